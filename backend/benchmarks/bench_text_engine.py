@@ -0,0 +1,159 @@
+"""Микро-бенчмарк: text_engine против прежних реализаций clean_text / _clean_text / _is_math_noise.
+
+Запуск: python -m backend.benchmarks.bench_text_engine [--hours 3]
+"""
+import argparse
+import random
+import re
+import time
+
+from backend import text_engine
+
+
+# --- Прежние реализации (до text_engine), оставлены только для сравнения ---
+
+def legacy_clean_text(text: str) -> str:
+    if not text:
+        return ""
+    text = re.sub(r'\[\d{2}:\d{2}\.\d{3}\s*-->\s*\d{2}:\d{2}\.\d{3}\]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.replace('\xa0', ' ')
+    return text.strip()
+
+
+def legacy_normalize(text: str) -> str:
+    intro_patterns = [
+        r'здравствуйте\s+ребята', r'всем\s+привет', r'с\s+вами\s+реальные\s+венатор',
+        r'сегодня\s+на\s+уроке', r'мы\s+разберем', r'добро\s+пожаловать',
+        r'подписывайтесь\s+на\s+канал', r'ставьте\s+лайки'
+    ]
+    cleaned = text
+    for pattern in intro_patterns:
+        cleaned = re.sub(pattern, '', cleaned, flags=re.I)
+    cleaned = re.sub(r'\s+([.,!?])', r'\1', cleaned)
+    cleaned = re.sub(r'([.,!?])(?=[^\s])', r'\1 ', cleaned)
+    cleaned = cleaned.strip()
+    return re.sub(r'\s+', ' ', cleaned).strip()
+
+
+def legacy_is_math_noise(text: str) -> bool:
+    math_patterns = [
+        r'\d+\s*(?:плюс|минус|умножить|разделить|равно|равняется|получится|в\s+степени|в\s+квадрате)',
+        r'(?:плюс|минус|умножить|разделить|равно|равняется|получится)\s*\d+',
+        r'\d+\s*[+\-*/=]\s*\d+',
+        r'икс\s+равно', r'игрек\s+равно', r'зед\s+равно',
+        r'результате\s+у\s+нас\s+получится',
+        r'это\s+будет\s+минус\s+\d+',
+        r'вершина\s+параболы\s+у\s+нас\s+будет',
+        r'\d+\s+умножить\s+на\s+\d+',
+        r'квадрате\s+минус\s+\d+',
+        r'\d+\s+и\s+минус\s+\d+',
+        r'точку\s+нашли', r'координаты', r'ось\s+икс', r'ось\s+игрек'
+    ]
+    text_lower = text.lower()
+    digits = len(re.findall(r'\d', text))
+    letters = len(re.findall(r'[а-яё]', text_lower))
+    if digits > 0 and letters > 0 and (digits / letters) > 0.3:
+        return True
+    matches = 0
+    for pattern in math_patterns:
+        if re.search(pattern, text_lower):
+            matches += 1
+    return matches >= 1
+
+
+def legacy_sentences(text: str) -> list:
+    result = []
+    for s in re.split(r'(?<=[.!?])\s+', text):
+        s = s.strip()
+        if len(s) > 20 and not legacy_is_math_noise(s):
+            s = re.sub(r'[ ,;:-]+$', '', s)
+            if not s.endswith(('.', '!', '?')):
+                s += '.'
+            result.append(s)
+    return result
+
+
+# --- Синтетическая расшифровка ---
+
+SENTENCES = [
+    "Всем привет , ребята!",
+    "С вами Реальные Венатор.",
+    "Квадратичная функция — это функция вида y = ax^2 + bx + c,где a не равно нулю.",
+    "Квадрате минус 6 умножить на 3 и плюс 5 в результате у нас получится 9 минус 18.",
+    "Основное правило: если коэффициент a больше нуля, то ветви параболы направлены вверх.",
+    "Это очень важно запомнить для решения задач",
+    "Также стоит отметить, что графиком квадратичной функции является парабола.",
+    "Подписывайтесь на канал, ставьте лайки!",
+    "Производная показывает скорость изменения функции в данной точке .",
+    "Теперь найдем координаты вершины и отметим ось икс.",
+    "Таким образом, мы получаем важный вывод о поведении функции на бесконечности.",
+]
+
+
+def make_transcript(hours: float, seed: int = 1) -> str:
+    """Примерно 150 слов в минуту, как в обычной лекции."""
+    rng = random.Random(seed)
+    words_needed = int(hours * 60 * 150)
+    parts = []
+    words = 0
+    while words < words_needed:
+        s = rng.choice(SENTENCES)
+        parts.append(s)
+        words += len(s.split())
+        if rng.random() < 0.05:
+            parts.append("\n[00:12.345 --> 00:15.678]\xa0")
+    return " ".join(parts)
+
+
+def timeit(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(hours: float = 3.0) -> dict:
+    raw = make_transcript(hours)
+    cleaned = legacy_clean_text(raw)
+
+    # Проверяем, что новый движок дает тот же результат
+    assert text_engine.clean_text(raw) == cleaned
+    normalized = legacy_normalize(cleaned)
+    assert text_engine.normalize_transcript(cleaned) == normalized
+    assert list(text_engine.iter_content_sentences(normalized)) == legacy_sentences(normalized)
+
+    sentences = re.split(r'(?<=[.!?])\s+', normalized)
+    assert [text_engine.is_math_noise(x) for x in sentences] == [legacy_is_math_noise(x) for x in sentences]
+
+    results = {
+        "chars": len(raw),
+        "clean_text": (timeit(legacy_clean_text, raw), timeit(text_engine.clean_text, raw)),
+        "normalize": (timeit(legacy_normalize, cleaned), timeit(text_engine.normalize_transcript, cleaned)),
+        "math_noise": (
+            timeit(lambda xs: [legacy_is_math_noise(x) for x in xs], sentences),
+            timeit(lambda xs: [text_engine.is_math_noise(x) for x in xs], sentences),
+        ),
+        "sentences": (
+            timeit(legacy_sentences, normalized),
+            timeit(lambda t: list(text_engine.iter_content_sentences(t)), normalized),
+        ),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=float, default=3.0, help="Длина синтетической лекции в часах")
+    args = parser.parse_args()
+
+    results = run(args.hours)
+    print(f"Текст: {results.pop('chars')} символов ({args.hours} ч)")
+    for name, (old, new) in results.items():
+        print(f"{name:<12} было {old * 1000:8.1f} мс   стало {new * 1000:8.1f} мс   ускорение x{old / new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
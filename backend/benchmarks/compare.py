@@ -0,0 +1,47 @@
+"""Сравнение двух прогонов backend.benchmarks.run.
+
+Запуск: python -m backend.benchmarks.compare old.json new.json [--threshold 0.2]
+Код выхода 1, если хотя бы один этап замедлился больше порога.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """Возвращает строки (этап, было, стало, отношение, регрессия) по медианам."""
+    rows = []
+    for name, stats in new["stages"].items():
+        before = old["stages"].get(name)
+        if not before or "median_ms" not in before or "median_ms" not in stats:
+            continue
+        ratio = stats["median_ms"] / before["median_ms"] if before["median_ms"] else 1.0
+        rows.append((name, before["median_ms"], stats["median_ms"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое замедление (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    rows = compare(old, new, args.threshold)
+    for name, before, after, ratio, regressed in rows:
+        mark = "  РЕГРЕССИЯ" if regressed else ""
+        print(f"{name:<18} {before:10.3f} мс -> {after:10.3f} мс   x{ratio:.2f}{mark}")
+
+    if any(row[4] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Офлайн-бенчмарк по этапам конвейера: без сети, на записанных фикстурах и с заглушкой Gemini.
+
+Запуск: python -m backend.benchmarks.run [--repeat 5] [--output results.json]
+Сравнение: python -m backend.benchmarks.compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SUBTITLES_FIXTURE = os.path.join(FIXTURES_DIR, "subtitles_ru.json")
+AUDIO_FIXTURE = os.path.join(FIXTURES_DIR, "sample_audio.webm")
+
+URLS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?t=42",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&list=PL123",
+]
+
+
+# --- Заглушки внешних сервисов ---
+
+class FakeTranscriptList:
+    """Отдает записанные субтитры вместо YouTube."""
+
+    def __init__(self, fixture: dict):
+        self.fixture = fixture
+        self.is_generated = fixture["is_generated"]
+
+    def find_manually_created_transcript(self, languages):
+        if self.is_generated:
+            raise LookupError("manual transcript not recorded")
+        return self
+
+    def find_generated_transcript(self, languages):
+        return self
+
+    def fetch(self):
+        return self.fixture["snippets"]
+
+
+class FakeTranscriptApi:
+    fixture = None
+
+    def __init__(self, http_client=None):
+        self.http_client = http_client
+
+    def list(self, video_id):
+        return FakeTranscriptList(self.fixture)
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeChat:
+    def __init__(self, reply: str):
+        self.reply = reply
+
+    async def send_message_async(self, message):
+        return FakeResponse(self.reply)
+
+
+class FakeModel:
+    """Модель Gemini, которая сразу отвечает готовым конспектом в формате промпта:
+    название на первой строке, затем Markdown (иначе замерялся бы запасной разбор ответа)."""
+
+    reply = (
+        "Квадратичная функция\n"
+        "## Главное\n"
+        "- Графиком квадратичной функции является парабола.\n"
+        "- Если $a > 0$ , ветви параболы направлены вверх.\n"
+    )
+
+    def start_chat(self, history=None):
+        return FakeChat(self.reply)
+
+
+def install_stubs():
+    """Подменяет YouTube и Gemini до первого обращения к сервисам."""
+    import youtube_transcript_api
+    from backend.services.gemini_service import gemini_service
+
+    with open(SUBTITLES_FIXTURE, encoding="utf-8") as f:
+        FakeTranscriptApi.fixture = json.load(f)
+    # Транскрибер импортирует API при первом запросе субтитров, поэтому подменяем в самом пакете
+    youtube_transcript_api.YouTubeTranscriptApi = FakeTranscriptApi
+
+    gemini_service.api_key = "benchmark"
+    gemini_service.client.hedging = False
+    gemini_service.client.limiter.rate = 0
+    for name in gemini_service.models_priority:
+        gemini_service.client._models[name] = FakeModel()
+
+
+# --- Измерение ---
+
+def measure(func, repeat: int) -> dict:
+    func()  # Прогрев: ленивые импорты, компиляция регулярных выражений, кэш ОС
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+    }
+
+
+def make_history(messages: int = 200) -> list:
+    """История чата во всех форматах, которые присылает фронтенд."""
+    history = []
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        if i % 3 == 0:
+            history.append({"role": role, "content": f"Сообщение {i}: объясни тему еще раз"})
+        elif i % 3 == 1:
+            history.append({"role": role, "parts": [{"text": f"Ответ {i}"}, "продолжение ответа"]})
+        else:
+            history.append({"role": role, "parts": [f"Сообщение {i}"]})
+    return history
+
+
+def run(repeat: int = 5) -> dict:
+    install_stubs()
+
+    from backend.config import MODELS_CPP_DIR, WHISPER_MODEL_SIZE
+    from backend.services.cache import TwoTierCache
+    from backend.services.gemini_service import gemini_service
+    from backend.services.summarizer import SummarizationService
+    from backend.services.transcriber import TranscriptionService, WHISPER_AVAILABLE, load_wav
+    from backend.utils import clean_text, extract_video_id
+
+    scratch = tempfile.mkdtemp(prefix="focus-bench-")
+    try:
+        transcriber = TranscriptionService()
+        summarizer = SummarizationService()
+
+        subtitles, _ = transcriber.fetch_subtitles("dQw4w9WgXcQ")
+        raw = " ".join(item["text"] for item in FakeTranscriptApi.fixture["snippets"])
+        history = make_history()
+
+        def summarize_with_ai():
+            # Свежий кэш на каждый прогон, иначе со второго раза меряется только чтение из кэша
+            summarizer.cache = TwoTierCache(
+                os.path.join(scratch, "summaries", str(time.perf_counter_ns())),
+                max_entries=16, max_bytes=1 << 20, ttl=60,
+            )
+            asyncio.run(summarizer.summarize_with_ai(subtitles))
+
+        wav_path = os.path.join(scratch, "sample_16k.wav")
+
+        stages = {
+            "extract_video_id": lambda: [extract_video_id(url) for url in URLS * 200],
+            "fetch_subtitles": lambda: transcriber.fetch_subtitles("dQw4w9WgXcQ"),
+            "clean_text": lambda: clean_text(raw),
+            "summarize_local": lambda: summarizer.summarize(subtitles),
+            "convert_history": lambda: gemini_service.convert_history(history),
+            "summarize_with_ai": summarize_with_ai,
+            "ffmpeg_convert": lambda: transcriber.convert_to_wav(AUDIO_FIXTURE, wav_path),
+        }
+
+        results = {}
+        for name, func in stages.items():
+            print(f"  {name}...")
+            results[name] = measure(func, repeat)
+
+        model_file = os.path.join(MODELS_CPP_DIR, f"ggml-{WHISPER_MODEL_SIZE}.bin")
+        if WHISPER_AVAILABLE and os.path.exists(model_file):
+            transcriber.convert_to_wav(AUDIO_FIXTURE, wav_path)
+            samples = load_wav(wav_path)
+            # Модель загружается при прогреве и не попадает в замеры
+            print("  transcribe_local...")
+            results["transcribe_local"] = measure(lambda: transcriber.transcribe_local(samples), repeat)
+        else:
+            print(f"  transcribe_local пропущен: нет {model_file}")
+            results["transcribe_local"] = {"skipped": "model not available"}
+        return results
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Количество замеров на этап")
+    parser.add_argument("--output", help="Файл для результатов (по умолчанию results/<commit>.json)")
+    args = parser.parse_args()
+
+    commit = current_commit()
+    print(f"Бенчмарк этапов (коммит {commit}):")
+    stages = run(args.repeat)
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "stages": stages,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, stats in stages.items():
+        if "skipped" in stats:
+            print(f"{name:<18} пропущен")
+        else:
+            print(f"{name:<18} медиана {stats['median_ms']:10.3f} мс   мин {stats['min_ms']:10.3f} мс")
+    print(f"Результаты: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,3 +25,120 @@ PORT = int(os.getenv("PORT", 8001))
 
 # Настройки ИИ
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+
+# Настройки фоновых задач (/jobs)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))          # Сколько тяжелых задач (Whisper и т.п.) выполняется одновременно
+JOB_MAX_STORED = int(os.getenv("JOB_MAX_STORED", 500))  # Сколько задач держим в памяти
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 3600)) # Сколько секунд хранить результат завершенной задачи
+JOB_MAX_WAIT = 30                                       # Максимальное время long-poll в секундах
+
+# Кэш транскриптов (по ID видео YouTube)
+TRANSCRIPT_CACHE_DIR = os.path.join(TEMP_DIR, "cache", "transcripts")
+TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", 7 * 24 * 3600))               # 7 дней
+TRANSCRIPT_CACHE_MEMORY_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MEMORY_ENTRIES", 256))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", 200 * 1024 * 1024))  # 200 МБ на диске
+
+# Кэш конспектов (по хэшу текста, версии промпта и модели)
+SUMMARY_CACHE_DIR = os.path.join(TEMP_DIR, "cache", "summaries")
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", 30 * 24 * 3600))            # 30 дней для ответов Gemini
+SUMMARY_CACHE_LOCAL_TTL = int(os.getenv("SUMMARY_CACHE_LOCAL_TTL", 6 * 3600))      # Локальные конспекты живут меньше
+SUMMARY_CACHE_MEMORY_ENTRIES = int(os.getenv("SUMMARY_CACHE_MEMORY_ENTRIES", 128))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+
+# Потоковый режим аудио: yt-dlp -> ffmpeg -> PCM в памяти -> whisper.cpp, без временных файлов
+AUDIO_STREAMING = os.getenv("AUDIO_STREAMING", "1") == "1"
+AUDIO_SAMPLE_RATE = 16000  # whisper.cpp ожидает 16 кГц моно
+AUDIO_STREAMING_MAX_SECONDS = int(os.getenv("AUDIO_STREAMING_MAX_SECONDS", 2 * 3600))  # Длиннее — через временный файл
+
+# Параллельная транскрибация длинного аудио (фрагменты по паузам в пуле процессов)
+WHISPER_PARALLEL_WORKERS = int(os.getenv("WHISPER_PARALLEL_WORKERS", os.cpu_count() or 1))
+WHISPER_PARALLEL_MIN_SECONDS = int(os.getenv("WHISPER_PARALLEL_MIN_SECONDS", 120))  # Короткое аудио распознаем целиком
+WHISPER_CHUNK_SECONDS = int(os.getenv("WHISPER_CHUNK_SECONDS", 45))                  # Целевая длина фрагмента
+WHISPER_CHUNK_OVERLAP_SECONDS = 1.0                                                  # Перекрытие на стыке фрагментов
+
+# Пул моделей Whisper
+WHISPER_POOL_SIZE = int(os.getenv("WHISPER_POOL_SIZE", 1))          # Сколько экземпляров модели держим одновременно
+WHISPER_N_THREADS = int(os.getenv("WHISPER_N_THREADS", 4))          # Потоки whisper.cpp на один экземпляр
+WHISPER_IDLE_TTL = int(os.getenv("WHISPER_IDLE_TTL", 900))          # Через сколько секунд простоя выгружать модель
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "1") == "1"          # Загружать модели при старте сервера
+
+# Map-reduce суммаризация длинных транскриптов
+SUMMARY_LONG_TEXT_TOKENS = int(os.getenv("SUMMARY_LONG_TEXT_TOKENS", 12000))  # Длиннее — режем на части
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 6000))           # Бюджет одной части
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))        # Одновременных запросов к Gemini на этапе map
+SUMMARY_MAX_MAP_PASSES = int(os.getenv("SUMMARY_MAX_MAP_PASSES", 3))          # Предел повторных map-этапов
+
+# Клиент Gemini: ограничение частоты и охлаждение моделей после ошибок
+GEMINI_RATE_PER_SECOND = float(os.getenv("GEMINI_RATE_PER_SECOND", 5))  # Средняя частота запросов (0 — без ограничения)
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", 10))                       # Допустимый всплеск запросов
+GEMINI_COOLDOWN_429 = 30         # Пауза для модели после 429 (растет при повторах)
+GEMINI_COOLDOWN_403 = 600        # Пауза после 403 (ключ/доступ)
+GEMINI_COOLDOWN_ERROR = 10       # Пауза после серии прочих ошибок
+GEMINI_FAILURES_TO_OPEN = 3      # Сколько прочих ошибок подряд отключают модель
+
+# Хеджирование запросов к Gemini: если основная модель медлит, параллельно запускаем следующую
+GEMINI_HEDGING = os.getenv("GEMINI_HEDGING", "0") == "1"   # Включается явно
+GEMINI_HEDGE_QUANTILE = 0.95     # Задержка хеджа = этот квантиль задержек основной модели
+GEMINI_HEDGE_DEFAULT_DELAY = 5.0 # Пока статистики мало
+GEMINI_HEDGE_MIN_DELAY = 1.0
+GEMINI_HEDGE_MAX_DELAY = 15.0
+GEMINI_LATENCY_WINDOW = 200      # Сколько последних задержек хранить на модель
+
+# Локальный (экстрактивный) суммаризатор
+SUMMARY_EXTRACTIVE_MAX_CHARS = int(os.getenv("SUMMARY_EXTRACTIVE_MAX_CHARS", 4000))  # Бюджет раздела "Теоретическая база"
+
+# Логирование и метрики
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # DEBUG, INFO, WARNING, ERROR
+
+# Распознавание расписания по фото
+SCHEDULE_IMAGE_MAX_SIDE = int(os.getenv("SCHEDULE_IMAGE_MAX_SIDE", 1600))  # Длинная сторона после уменьшения, px
+SCHEDULE_IMAGE_QUALITY = 85                     # Качество JPEG при перекодировании
+SCHEDULE_CACHE_DIR = os.path.join(TEMP_DIR, "cache", "schedules")
+SCHEDULE_CACHE_TTL = int(os.getenv("SCHEDULE_CACHE_TTL", 3 * 24 * 3600))   # Расписание меняется не чаще раза в неделю
+SCHEDULE_CACHE_MEMORY_ENTRIES = 256
+SCHEDULE_CACHE_MAX_BYTES = 20 * 1024 * 1024
+SCHEDULE_HASH_MAX_DISTANCE = int(os.getenv("SCHEDULE_HASH_MAX_DISTANCE", 10))  # Допустимое число различающихся бит из 256 (разные таблицы одного шаблона отличаются на 30+)
+SCHEDULE_COMBINED = os.getenv("SCHEDULE_COMBINED", "1") == "1"  # Обе группы одним запросом к модели, ответ режется по группе
+SCHEDULE_UPLOAD_MAX_BYTES = int(os.getenv("SCHEDULE_UPLOAD_MAX_BYTES", 15 * 1024 * 1024))  # Больше фото с телефона не бывает
+UPLOAD_CHUNK_SIZE = 256 * 1024                  # Размер блока при чтении загрузки
+VISION_MAX_CONCURRENT = int(os.getenv("VISION_MAX_CONCURRENT", 4))  # Одновременных распознаваний; остальным сразу 503
+VISION_RETRY_AFTER = 5                          # Retry-After (сек) в ответе 503
+
+# Серверные сессии чата
+CHAT_SESSIONS_MAX = int(os.getenv("CHAT_SESSIONS_MAX", 1000))         # Сессий в памяти (LRU)
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", 6 * 3600))       # Неактивная сессия удаляется через столько секунд
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 3000))  # Выше — старые реплики сжимаются в резюме
+CHAT_KEEP_RECENT_MESSAGES = 6                   # Сколько последних сообщений не сжимается никогда
+
+# Пакетная суммаризация (/summarize/batch)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))                    # Видео в одном запросе (после раскрытия плейлистов)
+BATCH_SUBTITLE_CONCURRENCY = int(os.getenv("BATCH_SUBTITLE_CONCURRENCY", 16))  # Субтитры — легкие сетевые запросы
+BATCH_WHISPER_CONCURRENCY = int(os.getenv("BATCH_WHISPER_CONCURRENCY", 1))    # Whisper — тяжелый CPU
+BATCH_GEMINI_CONCURRENCY = int(os.getenv("BATCH_GEMINI_CONCURRENCY", 4))      # Gemini — квота API
+
+# HTTP-клиент для YouTube (субтитры)
+HTTP_CONNECT_TIMEOUT = 3.05     # Секунды на установку соединения
+HTTP_READ_TIMEOUT = 10          # Секунды ожидания ответа
+HTTP_RETRIES = 2                # Повторы при обрыве соединения и 5xx
+HTTP_BACKOFF = 0.3              # База экспоненциальной паузы между повторами
+HTTP_BACKOFF_JITTER = 0.3       # Случайная добавка к паузе, чтобы повторы не шли синхронно
+HTTP_POOL_SIZE = 32             # Keep-alive соединений на хост
+SUBTITLES_LIST_TTL = int(os.getenv("SUBTITLES_LIST_TTL", 300))  # Сколько секунд помнить список субтитров видео
+
+# Спекулятивная загрузка аудио параллельно с поиском субтитров
+SUBTITLES_SPECULATION = os.getenv("SUBTITLES_SPECULATION", "history")  # off | always | history
+SPECULATION_MAX_CONCURRENT = int(os.getenv("SPECULATION_MAX_CONCURRENT", 2))  # Одновременных спекулятивных загрузок
+SPECULATION_MIN_SAMPLES = 2          # Сколько видео канала нужно увидеть, прежде чем доверять статистике
+SPECULATION_MIN_MISS_RATE = 0.5      # Доля видео канала без субтитров, при которой загрузка стартует сразу
+CAPTION_HISTORY_ENTRIES = 4096       # Видео и каналов в памяти
+CAPTION_HISTORY_TTL = 7 * 24 * 3600  # Сколько помнить, были ли у видео субтитры
+CHANNEL_LOOKUP_TIMEOUT = 2           # Секунды на запрос канала видео через oEmbed
+
+# Временные файлы загрузок: директория на задачу, общая квота и уборка брошенных файлов
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", os.path.join(TEMP_DIR, "scratch"))
+SCRATCH_TMPFS = os.getenv("SCRATCH_TMPFS", "0") == "1"                           # Держать файлы в /dev/shm (RAM)
+SCRATCH_QUOTA_BYTES = int(os.getenv("SCRATCH_QUOTA_MB", 2048)) * 1024 * 1024     # Общий лимит на все загрузки
+SCRATCH_DEFAULT_JOB_BYTES = 300 * 1024 * 1024                                    # Резерв, если длительность неизвестна
+SCRATCH_WAIT_TIMEOUT = int(os.getenv("SCRATCH_WAIT_TIMEOUT", 300))               # Сколько ждать места при полной квоте
+SCRATCH_ORPHAN_TTL = int(os.getenv("SCRATCH_ORPHAN_TTL", 6 * 3600))              # Файлы старше — брошенные
+SCRATCH_SWEEP_INTERVAL = 600                                                     # Период уборки в секундах
@@ -0,0 +1,40 @@
+"""Неблокирующее логирование: обработчики пишут в очередь, вывод делает отдельный поток."""
+import atexit
+import logging
+import logging.handlers
+import queue
+
+from backend.config import LOG_LEVEL
+
+_listener = None
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """Настраивает корневой логгер один раз на процесс.
+
+    Запись в stdout идет в потоке QueueListener, поэтому вызов logger.info()
+    в обработчике запроса не ждет вывода в консоль.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    records = queue.SimpleQueue()
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(records))
+
+    _listener = logging.handlers.QueueListener(records, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся записи из очереди и останавливает поток вывода."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,25 +1,61 @@
 import sys
 import os
+import asyncio
+import importlib
+import json
+import logging
+import time
+from typing import List, Optional
+
+# Отсчет времени импорта приложения (попадает в отчет прогрева и в лог при старте)
+IMPORT_STARTED = time.perf_counter()
 
 # Решение проблемы WinError 1114 и дублирования библиотек
 if os.name == 'nt':
     os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 import uvicorn
 
 # Добавляем корневую директорию в путь, чтобы импорты работали
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Логирование настраивается до импорта сервисов, чтобы их сообщения при загрузке тоже попали в очередь
+from backend.logging_config import setup_logging, stop_logging
+setup_logging()
+
+from backend import metrics
 from backend.services.transcriber import TranscriptionService
 from backend.services.summarizer import SummarizationService
 from backend.services.gemini_service import gemini_service
-from backend.config import HOST, PORT
+from backend.services.batch import BatchSummarizer
+from backend.services.chat_sessions import ChatService
+from backend.services.jobs import JobManager
+from backend.services.singleflight import SingleFlight
+from backend.utils import extract_video_id
+from backend.services.transcriber import WHISPER_AVAILABLE, ffmpeg_exe
+from backend.services.warmup import Warmup
+from backend.services.image_processing import prepare_image
+from backend.services.uploads import (
+    AdmissionLimiter, BodySizeLimitMiddleware, UploadRejected, parse_image_form, read_image_upload,
+)
+from backend.config import (
+    HOST, PORT, JOB_MAX_WAIT, WHISPER_PRELOAD,
+    SCHEDULE_UPLOAD_MAX_BYTES, VISION_MAX_CONCURRENT, VISION_RETRY_AFTER,
+)
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="FocusPoint Transcription & Summarization API")
 
+# Тело /recognize-schedule больше лимита отклоняется до разбора формы.
+# Добавляется до CORS, чтобы оказаться внутри него: иначе у ответа 413 нет CORS-заголовков
+# и браузер видит непрозрачную ошибку вместо «файл слишком большой»
+app.add_middleware(BodySizeLimitMiddleware, limits={"/recognize-schedule": SCHEDULE_UPLOAD_MAX_BYTES})
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -29,17 +65,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Время ответа и число запросов в работе по шаблону пути (а не по конкретному URL)."""
+    started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        template = getattr(route, "path", None) or "unmatched"
+        metrics.HTTP_SECONDS.labels(template, request.method, str(status)).observe(time.perf_counter() - started)
+
 # Инициализация сервисов
 transcriber = TranscriptionService()
 summarizer = SummarizationService()
+job_manager = JobManager()
+transcribe_flight = SingleFlight()
+vision_limiter = AdmissionLimiter(VISION_MAX_CONCURRENT)
+chat_service = ChatService()
+batch_summarizer = BatchSummarizer(transcriber, summarizer, job_manager.run_blocking)
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+def _preload_whisper():
+    transcriber.model_pool.preload()
+    if not transcriber.model_pool.stats()["loaded"]:
+        raise RuntimeError("модель Whisper не загружена")
+
+def _prewarm_parallel_whisper():
+    # Процессы пула стартуют через spawn и грузят свою модель — делаем это до первого запроса
+    transcriber.parallel.prewarm()
+
+# Тяжелые зависимости импортируются лениво; прогрев подгружает их в фоне, до первого запроса
+warmup = Warmup()
+warmup.record("app_import", IMPORT_SECONDS)
+warmup.add("import_yt_dlp", lambda: importlib.import_module("yt_dlp"))
+warmup.add("import_youtube_transcript_api", lambda: importlib.import_module("youtube_transcript_api"))
+warmup.add("import_genai", lambda: importlib.import_module("google.generativeai"))
+warmup.add("ffmpeg", ffmpeg_exe)
+if WHISPER_AVAILABLE and WHISPER_PRELOAD:
+    warmup.add("whisper_model", _preload_whisper, required=False)
+    if transcriber.parallel is not None:
+        warmup.add("whisper_parallel", _prewarm_parallel_whisper, required=False)
 
 class TranscribeRequest(BaseModel):
     url: str
 
+async def run_transcription(url: str, progress=None) -> str:
+    """Транскрибация в пуле воркеров, чтобы не блокировать event loop.
+
+    Одновременные запросы одного и того же видео ждут одну общую транскрибацию.
+    """
+    key = extract_video_id(url) or url
+    return await transcribe_flight.do(key, lambda: job_manager.run_blocking(transcriber.process, url, progress))
+
+async def run_summarization(url: str, progress=None) -> dict:
+    """Полный конвейер: текст видео -> конспект через Gemini."""
+    text = await run_transcription(url, progress)
+    if not text or "Ошибка:" in text:
+        raise ValueError(f"Не удалось получить текст видео: {text}")
+
+    if progress:
+        progress("summarizing", {})
+    result = await summarizer.summarize_with_ai(text)
+    return {
+        "transcription": text,
+        "summary": result["summary"],
+        "title": result["title"]
+    }
+
+async def _transcribe_job(payload: dict, progress) -> dict:
+    text = await run_transcription(payload["url"], progress)
+    if not text or "Ошибка:" in text:
+        raise ValueError(text or "Не удалось получить текст видео")
+    return {"transcription": text}
+
+async def _summarize_job(payload: dict, progress) -> dict:
+    return await run_summarization(payload["url"], progress)
+
+job_manager.register("transcribe", _transcribe_job)
+job_manager.register("summarize", _summarize_job)
+
+@app.on_event("startup")
+async def start_warmup():
+    # Прогрев в фоне: сервер начинает отвечать сразу, а трафик получает после /readyz
+    logger.info("Приложение импортировано за %.0f мс", IMPORT_SECONDS * 1000)
+    transcriber.model_pool.start_reaper()
+    transcriber.scratch.start_sweeper()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    job_manager.shutdown()
+    transcriber.shutdown()
+    stop_logging()
+
 @app.post("/transcribe")
 async def transcribe_video(request: TranscribeRequest):
     try:
-        text = transcriber.process(request.url)
+        text = await run_transcription(request.url)
         return {
             "status": "ok",
             "transcription": text
@@ -47,27 +176,26 @@ async def transcribe_video(request: TranscribeRequest):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Ошибка при транскрибации: {e}")
+        logger.exception("Ошибка при транскрибации: %s", e)
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
 @app.post("/summarize")
 async def summarize_video(request: TranscribeRequest):
     try:
         # 1. Сначала транскрибируем
-        print(f"\n{'='*50}")
-        print(f"ПОЛУЧЕН ЗАПРОС НА СУММАРИЗАЦИЮ: {request.url}")
-        text = transcriber.process(request.url)
+        logger.info("Запрос на суммаризацию: %s", request.url)
+        text = await run_transcription(request.url)
         
         if not text or "Ошибка:" in text:
-            print(f"ОШИБКА ТРАНСКРИБАЦИИ: {text}")
+            logger.warning("Ошибка транскрибации: %s", text)
             raise HTTPException(status_code=400, detail=f"Не удалось получить текст видео: {text}")
 
-        print(f"\n--- ИСХОДНЫЙ ТЕКСТ ИЗ СУБТИТРОВ ---")
-        print(text)
-        print(f"--- КОНЕЦ ИСХОДНОГО ТЕКСТА ---\n")
+        # Полный текст — только на уровне DEBUG: в INFO достаточно длины
+        logger.info("Текст получен: %d символов", len(text))
+        logger.debug("Исходный текст: %s", text)
 
         # 2. Затем суммаризируем
-        print("Запуск ИИ-суммаризации через Gemini...")
+        logger.info("Запуск ИИ-суммаризации через Gemini...")
         result = await summarizer.summarize_with_ai(text)
         
         return {
@@ -79,37 +207,246 @@ async def summarize_video(request: TranscribeRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Ошибка при суммаризации: {e}")
+        logger.exception("Ошибка при суммаризации: %s", e)
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
+def sse_event(event: str, data: dict) -> str:
+    """Форматирует одно событие Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/summarize/stream")
+async def summarize_stream(url: str):
+    """SSE-версия /summarize: этапы обработки, сегменты Whisper и конспект по мере генерации."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def progress(stage, data=None):
+        # Вызывается из рабочих потоков, поэтому передаем событие в event loop потокобезопасно
+        loop.call_soon_threadsafe(queue.put_nowait, (stage, data or {}))
+
+    async def events():
+        task = asyncio.ensure_future(run_transcription(url, progress))
+        try:
+            while not task.done() or not queue.empty():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    stage, data = getter.result()
+                    yield sse_event("segment" if stage == "segment" else "stage", {"stage": stage, **data})
+                else:
+                    getter.cancel()
+
+            text = task.result()
+            if not text or "Ошибка:" in text:
+                yield sse_event("error", {"detail": f"Не удалось получить текст видео: {text}"})
+                return
+            yield sse_event("transcription", {"transcription": text})
+
+            yield sse_event("stage", {"stage": "summarizing"})
+            async for kind, payload in summarizer.stream_with_ai(text):
+                if kind == "chunk":
+                    yield sse_event("summary_chunk", {"text": payload})
+                elif kind == "error":
+                    yield sse_event("error", payload)
+                else:
+                    yield sse_event("done", {"title": payload["title"], "summary": payload["summary"]})
+        except Exception as e:
+            logger.exception("Ошибка при потоковой суммаризации: %s", e)
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BatchRequest(BaseModel):
+    urls: List[str] = []
+    url: Optional[str] = None  # Одна ссылка (например, на плейлист) вместо списка
+    include_transcription: bool = False
+
+@app.post("/summarize/batch")
+async def summarize_batch(request: BatchRequest):
+    """Пакетная суммаризация списка видео и плейлистов.
+
+    Ответ — NDJSON: строка batch с составом пакета, по строке item на каждое видео
+    в порядке готовности и итоговая строка done.
+    """
+    urls = list(request.urls) + ([request.url] if request.url else [])
+    if not urls:
+        raise HTTPException(status_code=400, detail="Не переданы ссылки на видео или плейлист")
+
+    async def lines():
+        try:
+            async for event in batch_summarizer.run(urls, request.include_transcription):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.exception("Ошибка пакетной суммаризации: %s", e)
+            yield json.dumps({"type": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+class JobRequest(BaseModel):
+    url: str
+    kind: str = "summarize"  # "summarize" или "transcribe"
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    try:
+        job = job_manager.submit(request.kind, {"url": request.url})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "job_id": job.id, "job": job.to_dict()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Статус задачи. wait > 0 включает long-poll до завершения задачи."""
+    job = await job_manager.wait(job_id, min(max(wait, 0), JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return {"status": "ok", "job": job.to_dict()}
+
 @app.post("/recognize-schedule")
-async def recognize_schedule(file: UploadFile = File(...), group: str = ""):
+async def recognize_schedule(request: Request, group: str = ""):
+    # Место проверяется до чтения тела: при перегрузке клиент сразу получает 503
+    if not vision_limiter.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="Сервер распознавания перегружен, попробуйте позже",
+            headers={"Retry-After": str(VISION_RETRY_AFTER)},
+        )
+    form = None
     try:
-        content = await file.read()
-        result = await gemini_service.recognize_schedule_from_image(content, file.content_type, group)
+        # Форма разбирается вручную: тело не читается раньше проверки лимита,
+        # а файл проверяется по типу, сигнатуре и размеру прямо во время чтения
+        form = await parse_image_form(request, SCHEDULE_UPLOAD_MAX_BYTES)
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=422, detail="Не передан файл (поле file)")
+        content, mime_type = await read_image_upload(upload, SCHEDULE_UPLOAD_MAX_BYTES)
+
+        image_data, mime_type, phash = await asyncio.to_thread(prepare_image, content, mime_type)
+        # Исходное фото (до 15 МБ) не держим в памяти на время запросов к моделям
+        del content
+        result = await gemini_service.recognize_prepared_schedule(image_data, mime_type, phash, group)
         if result is None:
             raise HTTPException(status_code=500, detail="Не удалось распознать расписание")
         return {"status": "ok", "schedule": result}
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
-        print(f"Ошибка при распознавании расписания: {e}")
+        logger.exception("Ошибка при распознавании расписания: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Временные файлы формы освобождаются и при ошибках (413, 415, сбой модели)
+        if form is not None:
+            await form.close()
+        vision_limiter.release()
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/livez")
+async def liveness():
+    """Процесс жив и event loop отвечает. Для перезапуска зависших экземпляров."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Готовность принимать трафик: тяжелые импорты, ffmpeg и модель Whisper прогреты."""
+    report = warmup.report()
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+@app.get("/stats")
+async def get_stats():
+    return {
+        "status": "ok",
+        "whisper_pool": transcriber.model_pool.stats(),
+        "transcript_cache": transcriber.cache.stats(),
+        "scratch": transcriber.scratch.stats(),
+        "caption_history": {"speculation": transcriber.speculation, **transcriber.caption_history.stats()},
+        "summary_cache": summarizer.cache.stats(),
+        "gemini": gemini_service.client.stats(),
+        "schedule_cache": gemini_service.schedule_cache.stats(),
+        "vision": vision_limiter.stats(),
+        "chat": chat_service.stats(),
+        "warmup": warmup.report(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в формате Prometheus."""
+    if not metrics.PROMETHEUS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="prometheus_client не установлен")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 class ChatRequest(BaseModel):
     message: str
     history: list = []
+    session_id: Optional[str] = None
 
 @app.post("/chat")
 async def chat_with_ai(request: ChatRequest):
+    """С session_id история хранится на сервере; без него и с history — прежний режим без состояния."""
     try:
-        response = await gemini_service.get_response(request.message, request.history)
-        return {"status": "ok", "response": response}
+        if request.session_id is None and request.history:
+            response = await gemini_service.get_response(request.message, request.history)
+            return {"status": "ok", "response": response}
+
+        session = chat_service.open_session(request.session_id, request.history)
+        response = await chat_service.reply(session, request.message)
+        return {"status": "ok", "response": response, "session_id": session.id}
     except Exception as e:
-        print(f"Ошибка в чате: {e}")
+        logger.exception("Ошибка в чате: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """SSE-версия /chat: части ответа по мере генерации.
+
+    События: session (id сессии), chunk (часть текста), done (полный ответ), error.
+    При отключении клиента генерация у модели прекращается.
+    """
+    if request.session_id is None and request.history:
+        session = None
+        stream = gemini_service.stream_response(request.message, gemini_service.convert_history(request.history))
+    else:
+        session = chat_service.open_session(request.session_id, request.history)
+        stream = chat_service.stream_reply(session, request.message)
+
+    async def events():
+        parts = []
+        try:
+            if session is not None:
+                yield sse_event("session", {"session_id": session.id})
+            async for model_name, chunk in stream:
+                if await http_request.is_disconnected():
+                    logger.info("Клиент отключился, генерация ответа чата прервана")
+                    return
+                parts.append(chunk)
+                yield sse_event("chunk", {"text": chunk, "model": model_name})
+            yield sse_event("done", {"response": "".join(parts)})
+        except Exception as e:
+            logger.error("Ошибка потокового чата: %s", e)
+            yield sse_event("error", {"detail": "Извините, возникла ошибка при обработке запроса. Пожалуйста, попробуйте позже."})
+        finally:
+            # Закрываем генератор явно, чтобы сразу отпустить соединение с моделью и блокировку сессии
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
@@ -0,0 +1,94 @@
+"""Метрики Prometheus: длительность этапов конвейера, вызовы Gemini, попадания в кэш, запросы в работе."""
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    PROMETHEUS_AVAILABLE = True
+except Exception as e:
+    logger.warning("prometheus_client не установлен, /metrics отключен: %s", e)
+    PROMETHEUS_AVAILABLE = False
+
+
+class _NoopMetric:
+    """Заглушка с интерфейсом метрики, когда prometheus_client не установлен."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+# Этапы длятся от миллисекунд (кэш) до десятков минут (Whisper на длинной лекции)
+STAGE_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+GEMINI_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+if PROMETHEUS_AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        "focuspoint_stage_seconds", "Длительность этапа обработки", ["stage"], buckets=STAGE_BUCKETS)
+    STAGE_IN_FLIGHT = Gauge(
+        "focuspoint_stage_in_flight", "Сколько этапов выполняется прямо сейчас", ["stage"])
+    STAGE_ERRORS = Counter(
+        "focuspoint_stage_errors_total", "Этапы, завершившиеся исключением", ["stage"])
+    GEMINI_CALLS = Counter(
+        "focuspoint_gemini_calls_total", "Вызовы Gemini по моделям", ["model", "label", "outcome"])
+    GEMINI_SECONDS = Histogram(
+        "focuspoint_gemini_call_seconds", "Задержка успешного вызова Gemini", ["model"], buckets=GEMINI_BUCKETS)
+    GEMINI_IN_FLIGHT = Gauge(
+        "focuspoint_gemini_in_flight", "Вызовы Gemini в работе", ["model"])
+    GEMINI_HEDGES = Counter(
+        "focuspoint_gemini_hedges_total", "Хеджированные вызовы Gemini (outcome: fired, won)", ["outcome"])
+    CACHE_REQUESTS = Counter(
+        "focuspoint_cache_requests_total", "Обращения к кэшам (result: memory, disk, miss)", ["cache", "result"])
+    HTTP_IN_FLIGHT = Gauge(
+        "focuspoint_http_requests_in_flight", "HTTP-запросы в обработке")
+    HTTP_SECONDS = Histogram(
+        "focuspoint_http_request_seconds", "Длительность HTTP-запроса", ["path", "method", "status"],
+        buckets=STAGE_BUCKETS)
+    SPECULATIVE_DOWNLOADS = Counter(
+        "focuspoint_speculative_downloads_total",
+        "Загрузки аудио параллельно с субтитрами (outcome: used, discarded)", ["outcome"])
+else:
+    STAGE_SECONDS = STAGE_IN_FLIGHT = STAGE_ERRORS = _NoopMetric()
+    GEMINI_CALLS = GEMINI_SECONDS = GEMINI_IN_FLIGHT = GEMINI_HEDGES = _NoopMetric()
+    CACHE_REQUESTS = HTTP_IN_FLIGHT = HTTP_SECONDS = _NoopMetric()
+    SPECULATIVE_DOWNLOADS = _NoopMetric()
+
+
+@contextmanager
+def span(stage: str):
+    """Замеряет этап: длительность, число одновременных выполнений и ошибки.
+
+    Подходит и для синхронного, и для async-кода (with внутри корутины).
+    """
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+        in_flight.dec()
+
+
+def render() -> tuple:
+    """Текст метрик в формате Prometheus и его Content-Type."""
+    if not PROMETHEUS_AVAILABLE:
+        return b"", "text/plain"
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import re
+import time
+from urllib.parse import parse_qs, urlparse
+
+from backend.config import (
+    BATCH_MAX_ITEMS, BATCH_SUBTITLE_CONCURRENCY, BATCH_WHISPER_CONCURRENCY, BATCH_GEMINI_CONCURRENCY,
+)
+from backend.utils import extract_video_id
+
+logger = logging.getLogger(__name__)
+
+
+YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be"}
+CHANNEL_PATH_RE = re.compile(r"^/(@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+)")
+
+
+def _youtube_url(url: str):
+    """Разобранная ссылка, если она ведет на YouTube; иначе None."""
+    url = url.strip()
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    return parsed if (parsed.hostname or "").lower() in YOUTUBE_HOSTS else None
+
+
+def is_collection_url(url: str) -> bool:
+    """Плейлист или канал YouTube: list= без v= или путь канала (/@name, /channel/, /c/, /user/)."""
+    parsed = _youtube_url(url)
+    if parsed is None or parsed.hostname.lower() == "youtu.be":
+        return False
+    query = parse_qs(parsed.query)
+    if "list" in query and "v" not in query:
+        return True
+    return bool(CHANNEL_PATH_RE.match(parsed.path))
+
+
+def expand_playlist(url: str, limit: int = BATCH_MAX_ITEMS) -> list:
+    """Список видео плейлиста без загрузки страниц каждого видео (flat-извлечение yt-dlp)."""
+    import yt_dlp
+    ydl_opts = {
+        'extract_flat': 'in_playlist',
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'playlistend': limit,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    items = []
+    for entry in info.get("entries") or []:
+        video_id = entry.get("id")
+        if not video_id or len(video_id) != 11:
+            continue
+        items.append({
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "video_id": video_id,
+            "title": entry.get("title"),
+            "channel_id": entry.get("channel_id") or info.get("channel_id"),
+        })
+    return items
+
+
+class BatchSummarizer:
+    """Пакетная суммаризация: субтитры, Whisper и Gemini ограничены отдельными семафорами.
+
+    Семафоры общие для всех пакетов, поэтому несколько одновременных пакетов
+    делят ресурсы, а не умножают нагрузку.
+    """
+
+    def __init__(self, transcriber, summarizer, run_blocking, max_items: int = BATCH_MAX_ITEMS):
+        self.transcriber = transcriber
+        self.summarizer = summarizer
+        # run_blocking(func, *args) — выполнение тяжелой синхронной работы в пуле воркеров
+        self.run_blocking = run_blocking
+        self.max_items = max_items
+        self.subtitles_slots = asyncio.Semaphore(BATCH_SUBTITLE_CONCURRENCY)
+        self.whisper_slots = asyncio.Semaphore(BATCH_WHISPER_CONCURRENCY)
+        self.gemini_slots = asyncio.Semaphore(BATCH_GEMINI_CONCURRENCY)
+
+    async def expand(self, urls: list) -> list:
+        """Раскрывает плейлисты и убирает повторы; не больше max_items видео."""
+        items = []
+        seen = set()
+        for url in urls:
+            if len(items) >= self.max_items:
+                break
+            if is_collection_url(url):
+                try:
+                    expanded = await asyncio.to_thread(expand_playlist, url, self.max_items - len(items))
+                except Exception as e:
+                    logger.error("Не удалось раскрыть плейлист %s: %s", url, e)
+                    items.append({"url": url, "video_id": None, "title": None, "error": f"Плейлист недоступен: {e}"})
+                    continue
+                if not expanded:
+                    items.append({"url": url, "video_id": None, "title": None, "error": "В плейлисте нет доступных видео"})
+                    continue
+            elif _youtube_url(url) is not None and extract_video_id(url):
+                expanded = [{"url": url, "video_id": extract_video_id(url), "title": None}]
+            else:
+                # Произвольные сайты yt-dlp не раскрываем: пакет работает только с YouTube
+                items.append({"url": url, "video_id": None, "title": None,
+                              "error": "Ссылка не ведет на видео, плейлист или канал YouTube"})
+                continue
+
+            for item in expanded:
+                if item["video_id"] in seen:
+                    continue
+                seen.add(item["video_id"])
+                items.append(item)
+                if len(items) >= self.max_items:
+                    break
+        return items
+
+    async def _process_item(self, item: dict, include_transcription: bool) -> dict:
+        if item.get("error"):
+            return {**item, "status": "error"}
+
+        video_id = item["video_id"]
+        async with self.subtitles_slots:
+            # То же решение о спекулятивной загрузке, что и для одиночного видео:
+            # у канала без субтитров аудио начинает качаться, пока видео ждет слот Whisper
+            text, prefetch = await asyncio.to_thread(self.transcriber.lookup_text, item["url"], video_id)
+        if not text:
+            try:
+                async with self.whisper_slots:
+                    text = await self.run_blocking(self.transcriber.transcribe_audio, item["url"], video_id, None, prefetch)
+            except BaseException:
+                # Пакет отменен до начала распознавания — начатая загрузка больше не нужна
+                if prefetch is not None and not prefetch.job.closed:
+                    prefetch.discard()
+                raise
+        if not text or "Ошибка:" in text:
+            return {**item, "status": "error", "error": text or "Не удалось получить текст видео"}
+
+        async with self.gemini_slots:
+            result = await self.summarizer.summarize_with_ai(text)
+
+        response = {**item, "status": "ok", "summary_title": result["title"], "summary": result["summary"]}
+        if include_transcription:
+            response["transcription"] = text
+        return response
+
+    async def run(self, urls: list, include_transcription: bool = False):
+        """Асинхронный генератор событий: batch (состав пакета), item (по мере готовности), done."""
+        started = time.monotonic()
+        items = await self.expand(urls)
+        yield {"type": "batch", "total": len(items), "items": items}
+
+        async def process(index: int, item: dict):
+            try:
+                return index, await self._process_item(item, include_transcription)
+            except Exception as e:
+                logger.error("Ошибка пакетной обработки %s: %s", item.get("url"), e)
+                return index, {**item, "status": "error", "error": str(e)}
+
+        tasks = [asyncio.ensure_future(process(i, item)) for i, item in enumerate(items)]
+        ok = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, result = await finished
+                ok += result["status"] == "ok"
+                yield {"type": "item", "index": index, **result}
+        finally:
+            # Клиент отключился — незавершенные видео больше не нужны
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        yield {
+            "type": "done",
+            "total": len(items),
+            "ok": ok,
+            "failed": len(items) - ok,
+            "elapsed": round(time.monotonic() - started, 1),
+        }
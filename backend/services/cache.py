@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from backend.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш в памяти с TTL."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else 0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class DiskCache:
+    """JSON-кэш на диске: один файл на ключ, TTL и вытеснение по суммарному размеру (LRU по mtime)."""
+
+    def __init__(self, directory: str, max_bytes: int = 100 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, key: str):
+        return self.get_entry(key)[0]
+
+    def get_entry(self, key: str) -> tuple:
+        """(значение, expires_at) записи; expires_at == 0 — без срока. (None, 0) при промахе."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None, 0
+
+        if record.get("key") != key or (record.get("expires_at") and record["expires_at"] < time.time()):
+            self._remove(path)
+            self.misses += 1
+            return None, 0
+
+        # Обновляем mtime, чтобы вытеснение работало как LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return record.get("value"), record.get("expires_at") or 0
+
+    def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        record = {"key": key, "expires_at": time.time() + ttl if ttl else 0, "value": value}
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Не удалось записать кэш %s: %s", path, e)
+            self._remove(tmp_path)
+            return
+        self._evict()
+
+    def delete(self, key: str):
+        self._remove(self._path(key))
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Удаляет просроченные записи и самые старые файлы, пока размер превышает лимит."""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class TwoTierCache:
+    """Двухуровневый кэш: LRU в памяти поверх JSON-хранилища на диске.
+
+    Из event loop используются aget/aset: работа с файлами (и скан директории при вытеснении)
+    выполняется в пуле потоков, а не блокирует обработку других запросов.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 256, max_bytes: int = 100 * 1024 * 1024, ttl: float = 7 * 24 * 3600,
+                 name: str = "cache"):
+        self.name = name
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk = DiskCache(directory, max_bytes=max_bytes, ttl=ttl)
+
+    def get(self, key: str):
+        value = self._get_memory(key)
+        return value if value is not None else self._get_disk(key)
+
+    async def aget(self, key: str):
+        value = self._get_memory(key)
+        return value if value is not None else await asyncio.to_thread(self._get_disk, key)
+
+    def _get_memory(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_REQUESTS.labels(self.name, "memory").inc()
+        return value
+
+    def _get_disk(self, key: str):
+        value, expires_at = self.disk.get_entry(key)
+        if value is not None:
+            CACHE_REQUESTS.labels(self.name, "disk").inc()
+            # В памяти запись живет не дольше, чем на диске: короткий TTL (например, у локального
+            # конспекта) не должен продлеваться до TTL кэша по умолчанию
+            remaining = expires_at - time.time() if expires_at else 0
+            if not expires_at or remaining > 0:
+                self.memory.set(key, value, remaining)
+        else:
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
+        return value
+
+    def set(self, key: str, value, ttl: float = None):
+        self.memory.set(key, value, ttl)
+        self.disk.set(key, value, ttl)
+
+    async def aset(self, key: str, value, ttl: float = None):
+        self.memory.set(key, value, ttl)
+        await asyncio.to_thread(self.disk.set, key, value, ttl)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        self.disk.delete(key)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
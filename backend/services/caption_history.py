@@ -0,0 +1,67 @@
+import threading
+
+from backend.config import (
+    CAPTION_HISTORY_ENTRIES, CAPTION_HISTORY_TTL, SPECULATION_MIN_SAMPLES, SPECULATION_MIN_MISS_RATE,
+)
+from backend.services.cache import LRUCache
+
+
+class CaptionHistory:
+    """Память о том, у каких видео и каналов не было субтитров.
+
+    По ней решается, стоит ли начинать загрузку аудио, не дожидаясь ответа о субтитрах.
+    """
+
+    def __init__(self, max_entries: int = CAPTION_HISTORY_ENTRIES, ttl: float = CAPTION_HISTORY_TTL,
+                 min_samples: int = SPECULATION_MIN_SAMPLES, min_miss_rate: float = SPECULATION_MIN_MISS_RATE):
+        # video_id -> {"channel_id", "missing"}; channel_id -> {"missing", "total"}
+        self._videos = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._channels = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.min_samples = min_samples
+        self.min_miss_rate = min_miss_rate
+        self._lock = threading.Lock()
+
+    def record(self, video_id: str, has_captions: bool, channel_id: str = None):
+        with self._lock:
+            self._record(video_id, not has_captions, channel_id)
+
+    def set_channel(self, video_id: str, channel_id: str):
+        """Канал видео стал известен позже (ответ oEmbed пришел после субтитров) — учитываем видео в статистике канала."""
+        if not channel_id:
+            return
+        with self._lock:
+            previous = self._videos.get(video_id)
+            if previous is not None and previous["channel_id"] != channel_id:
+                self._record(video_id, previous["missing"], channel_id)
+
+    def _record(self, video_id: str, missing: bool, channel_id: str = None):
+        previous = self._videos.get(video_id)
+        if previous is not None:
+            channel_id = channel_id or previous["channel_id"]
+            # Повторный результат для того же видео заменяет прежний, а не добавляется к нему
+            if previous["channel_id"]:
+                self._count(previous["channel_id"], previous["missing"], -1)
+        if channel_id:
+            self._count(channel_id, missing, 1)
+        self._videos.set(video_id, {"channel_id": channel_id, "missing": missing})
+
+    def _count(self, channel_id: str, missing: bool, delta: int):
+        counts = self._channels.get(channel_id) or {"missing": 0, "total": 0}
+        counts["total"] = max(counts["total"] + delta, 0)
+        if missing:
+            counts["missing"] = max(counts["missing"] + delta, 0)
+        self._channels.set(channel_id, counts)
+
+    def likely_missing(self, video_id: str, channel_id: str = None) -> bool:
+        """True, если у видео (или у большинства видео канала) субтитров раньше не было."""
+        with self._lock:
+            video = self._videos.get(video_id)
+            if video is not None:
+                return video["missing"]
+            counts = self._channels.get(channel_id) if channel_id else None
+            if not counts or counts["total"] < self.min_samples:
+                return False
+            return counts["missing"] / counts["total"] >= self.min_miss_rate
+
+    def stats(self) -> dict:
+        return {"videos": len(self._videos), "channels": len(self._channels)}
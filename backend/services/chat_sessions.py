@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from backend.config import (
+    CHAT_SESSIONS_MAX, CHAT_SESSION_TTL, CHAT_HISTORY_TOKEN_BUDGET, CHAT_KEEP_RECENT_MESSAGES,
+)
+from backend.services.gemini_service import gemini_service
+from backend.services.summarizer import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_tokens(message: dict) -> int:
+    return sum(len(part) for part in message["parts"]) // CHARS_PER_TOKEN + 1
+
+
+class ChatSession:
+    """История одного разговора в формате Gemini и резюме уже сжатой части."""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.history = []
+        self.summary = ""
+        self.tokens = 0
+        self.compactions = 0
+        self.updated_at = time.time()
+        # Реплики одной сессии обрабатываются по очереди, сжатие тоже берет эту блокировку
+        self.lock = asyncio.Lock()
+
+    def append(self, role: str, text: str):
+        message = {"role": role, "parts": [text]}
+        self.history.append(message)
+        self.tokens += _estimate_tokens(message)
+        self.updated_at = time.time()
+
+    def model_history(self) -> list:
+        """История для start_chat: резюме старой части (если есть) и последние реплики."""
+        if not self.summary:
+            return self.history
+        return [
+            {"role": "user", "parts": [f"Краткое содержание нашего разговора до этого момента:\n{self.summary}"]},
+            {"role": "model", "parts": ["Понял, продолжаем с учетом этого."]},
+        ] + self.history
+
+
+class ChatSessionStore:
+    """Сессии чата в памяти с вытеснением по LRU и по времени неактивности."""
+
+    def __init__(self, max_sessions: int = CHAT_SESSIONS_MAX, ttl: float = CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def create(self, session_id: str = None) -> ChatSession:
+        session = ChatSession(session_id or uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+class ChatService:
+    """Чат с историей на сервере: клиент присылает только session_id и новое сообщение.
+
+    Когда история превышает бюджет токенов, старые реплики сжимаются в резюме,
+    поэтому стоимость одной реплики не растет с длиной разговора.
+    """
+
+    def __init__(self, store: ChatSessionStore = None, token_budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+                 keep_recent: int = CHAT_KEEP_RECENT_MESSAGES):
+        self.store = store or ChatSessionStore()
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self._compacting = set()
+        # Сильные ссылки на фоновые сжатия: event loop держит задачи только по слабым ссылкам
+        self._tasks = set()
+
+    def open_session(self, session_id: str = None, history: list = None) -> ChatSession:
+        """Возвращает существующую сессию или создает новую.
+
+        Если сессия истекла, клиент может восстановить ее, прислав историю еще раз.
+        """
+        session = self.store.get(session_id) if session_id else None
+        if session is None:
+            session = self.store.create(session_id)
+            for message in gemini_service.convert_history(history or []):
+                session.append(message["role"], message["parts"][0])
+        return session
+
+    async def reply(self, session: ChatSession, message: str) -> str:
+        async with session.lock:
+            response, model_name = await gemini_service.get_response_for_history(message, session.model_history())
+            # Неудачный ответ не попадает в историю: клиент повторит вопрос
+            if model_name is not None:
+                session.append("user", message)
+                session.append("model", response)
+
+        self._maybe_compact(session)
+        return response
+
+    async def stream_reply(self, session: ChatSession, message: str):
+        """Потоковый ответ: пары (имя модели, часть текста). Реплика попадает в историю только целиком.
+
+        Если клиент отключился, генератор закрывается посреди ответа и история не меняется.
+        """
+        async with session.lock:
+            parts = []
+            async for model_name, chunk in gemini_service.stream_response(message, session.model_history()):
+                parts.append(chunk)
+                yield model_name, chunk
+            session.append("user", message)
+            session.append("model", "".join(parts))
+        self._maybe_compact(session)
+
+    def _maybe_compact(self, session: ChatSession):
+        if session.tokens > self.token_budget and session.id not in self._compacting:
+            # Сжатие в фоне: текущий ответ не ждет лишнего запроса к модели
+            self._compacting.add(session.id)
+            task = asyncio.ensure_future(self._compact(session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _compact(self, session: ChatSession):
+        try:
+            async with session.lock:
+                if session.tokens <= self.token_budget or len(session.history) <= self.keep_recent:
+                    return
+                # Граница сжатия — по паре реплик, чтобы история начиналась с сообщения пользователя
+                cut = len(session.history) - self.keep_recent
+                cut -= cut % 2
+                old, recent = session.history[:cut], session.history[cut:]
+
+                summary, model_name = await gemini_service.get_response_for_history(
+                    self._build_compaction_prompt(session.summary, old), [])
+                if model_name is None:
+                    # Модели недоступны: просто отбрасываем старое, чтобы не превышать бюджет
+                    logger.warning("Не удалось сжать историю чата %s, старые реплики отброшены", session.id)
+                else:
+                    session.summary = summary.strip()
+
+                session.history = recent
+                session.tokens = sum(_estimate_tokens(m) for m in recent)
+                session.compactions += 1
+                logger.info("История чата %s сжата: %d реплик в резюме", session.id, len(old))
+        except Exception as e:
+            logger.error("Ошибка сжатия истории чата %s: %s", session.id, e)
+        finally:
+            self._compacting.discard(session.id)
+
+    def _build_compaction_prompt(self, summary: str, messages: list) -> str:
+        dialog = "\n".join(
+            f"{'Студент' if m['role'] == 'user' else 'Ассистент'}: {m['parts'][0]}" for m in messages
+        )
+        previous = f"Текущее резюме разговора:\n{summary}\n\n" if summary else ""
+        return f"""
+        Ты ведешь краткое резюме учебного диалога студента с ассистентом.
+        {previous}Новые реплики, которые нужно добавить в резюме:
+        {dialog}
+
+        Обнови резюме: сохрани темы, определения, формулы, договоренности и нерешенные вопросы студента.
+        Пиши по-русски, сжато, не более 200 слов. Верни только текст резюме.
+        """
+
+    def stats(self) -> dict:
+        return {**self.store.stats(), "compacting": len(self._compacting)}
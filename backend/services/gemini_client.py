@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from backend.metrics import GEMINI_CALLS, GEMINI_SECONDS, GEMINI_IN_FLIGHT, GEMINI_HEDGES
+from backend.config import (
+    GEMINI_RATE_PER_SECOND, GEMINI_BURST,
+    GEMINI_COOLDOWN_429, GEMINI_COOLDOWN_403, GEMINI_COOLDOWN_ERROR, GEMINI_FAILURES_TO_OPEN,
+    GEMINI_HEDGING, GEMINI_HEDGE_QUANTILE, GEMINI_HEDGE_DEFAULT_DELAY,
+    GEMINI_HEDGE_MIN_DELAY, GEMINI_HEDGE_MAX_DELAY, GEMINI_LATENCY_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AllModelsUnavailable(Exception):
+    """Ни одна модель не ответила или все находятся в периоде охлаждения."""
+
+
+class CircuitBreaker:
+    """Автомат отключения модели: после 429/403 или серии ошибок модель не вызывается до конца охлаждения."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.open_until = 0.0
+        self.failures = 0
+        self.opened = 0
+        self.last_error = None
+
+    def is_open(self) -> bool:
+        return time.time() < self.open_until
+
+    def remaining(self) -> float:
+        return max(self.open_until - time.time(), 0.0)
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        message = str(error)
+        self.last_error = message[:200]
+        if "429" in message:
+            # Повторные 429 подряд удлиняют охлаждение, но не больше чем в 8 раз
+            cooldown = GEMINI_COOLDOWN_429 * min(2 ** (self.failures - 1), 8)
+            logger.warning("Лимит запросов для %s, пауза %s сек", self.name, cooldown)
+        elif "403" in message:
+            cooldown = GEMINI_COOLDOWN_403
+            logger.error("Ошибка доступа/API ключа для %s, пауза %s сек", self.name, cooldown)
+        elif self.failures >= GEMINI_FAILURES_TO_OPEN:
+            cooldown = GEMINI_COOLDOWN_ERROR
+        else:
+            return
+        self.open_until = time.time() + cooldown
+        self.opened += 1
+
+    def stats(self) -> dict:
+        return {
+            "open": self.is_open(),
+            "cooldown_remaining": round(self.remaining(), 1),
+            "consecutive_failures": self.failures,
+            "times_opened": self.opened,
+            "last_error": self.last_error,
+        }
+
+
+class TokenBucket:
+    """Глобальный ограничитель частоты запросов: при всплеске запросы ждут локально, а не тратят квоту."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # Под блокировкой ожидающие обслуживаются строго по очереди
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                self.waits += 1
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class GeminiClient:
+    """Общий клиент Gemini: переиспользуемые объекты моделей, автоматы отключения и ограничитель частоты."""
+
+    def __init__(self, models_priority: list, api_key: str = None):
+        self.models_priority = models_priority
+        self.api_key = api_key
+        self._models = {}
+        self.breakers = {name: CircuitBreaker(name) for name in models_priority}
+        self.limiter = TokenBucket(GEMINI_RATE_PER_SECOND, GEMINI_BURST)
+        self.hedging = GEMINI_HEDGING
+        self.latencies = {}
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def model(self, name: str):
+        """Кэшированный объект GenerativeModel (создается один раз на модель)."""
+        model = self._models.get(name)
+        if model is None:
+            # google.generativeai импортируется долго, поэтому только при первом обращении к модели
+            import google.generativeai as genai
+            if self.api_key:
+                genai.configure(api_key=self.api_key)
+            model = genai.GenerativeModel(name)
+            self._models[name] = model
+        return model
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    def available_models(self) -> list:
+        """Модели по приоритету, кроме тех, что сейчас в охлаждении."""
+        return [name for name in self.models_priority if not self.breaker(name).is_open()]
+
+    def record_latency(self, name: str, seconds: float):
+        if name not in self.latencies:
+            self.latencies[name] = deque(maxlen=GEMINI_LATENCY_WINDOW)
+        self.latencies[name].append(seconds)
+
+    def hedge_delay(self, name: str) -> float:
+        """Через сколько секунд без ответа основной модели запускать хедж (по квантилю задержек)."""
+        samples = self.latencies.get(name)
+        if not samples or len(samples) < 20:
+            return GEMINI_HEDGE_DEFAULT_DELAY
+        ordered = sorted(samples)
+        value = ordered[min(int(len(ordered) * GEMINI_HEDGE_QUANTILE), len(ordered) - 1)]
+        return min(max(value, GEMINI_HEDGE_MIN_DELAY), GEMINI_HEDGE_MAX_DELAY)
+
+    @asynccontextmanager
+    async def _tracked(self, name: str, label: str, record_latency: bool = True):
+        """Учет одного вызова модели: ограничитель частоты, метрики и автомат отключения.
+
+        record_latency=False для потоковых вызовов: их длительность не годится для задержки хеджирования.
+        """
+        await self.limiter.acquire()
+        breaker = self.breaker(name)
+        in_flight = GEMINI_IN_FLIGHT.labels(name)
+        in_flight.inc()
+        started = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # Проигравший хедж или отключившийся клиент — это не ошибка модели
+            GEMINI_CALLS.labels(name, label, "cancelled").inc()
+            raise
+        except Exception as e:
+            logger.warning("Ошибка %s в модели %s: %s", label, name, e)
+            GEMINI_CALLS.labels(name, label, "error").inc()
+            breaker.record_failure(e)
+            raise
+        finally:
+            in_flight.dec()
+        elapsed = time.monotonic() - started
+        GEMINI_CALLS.labels(name, label, "ok").inc()
+        GEMINI_SECONDS.labels(name).observe(elapsed)
+        breaker.record_success()
+        if record_latency:
+            self.record_latency(name, elapsed)
+
+    async def _attempt(self, func, name: str, label: str):
+        """Один вызов модели с ограничителем частоты, учетом задержки и автоматом отключения."""
+        async with self._tracked(name, label):
+            return await func(self.model(name), name)
+
+    async def stream(self, func, label: str = "Stream"):
+        """Потоковый вызов: func(model, model_name) — асинхронный генератор частей текста.
+
+        Отдает пары (имя модели, часть) и переходит на следующую модель только до первой части:
+        после нее ошибка пробрасывается вызывающему. Бросает AllModelsUnavailable, если не ответила ни одна.
+        """
+        last_error = None
+        for name in self.available_models():
+            started = False
+            try:
+                async with self._tracked(name, label, record_latency=False):
+                    parts = func(self.model(name), name)
+                    try:
+                        async for part in parts:
+                            started = True
+                            yield name, part
+                    finally:
+                        await parts.aclose()
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+        if last_error is None:
+            raise AllModelsUnavailable("Все модели временно недоступны (период охлаждения)")
+        raise AllModelsUnavailable(str(last_error))
+
+    async def call(self, func, label: str = "Gemini", hedge: bool = None):
+        """Вызывает func(model, model_name) по очереди на доступных моделях.
+
+        hedge включает хеджирование первых двух моделей (по умолчанию — настройка GEMINI_HEDGING).
+        Возвращает (результат, имя модели) или бросает AllModelsUnavailable.
+        """
+        models = self.available_models()
+        hedge = self.hedging if hedge is None else hedge
+        last_error = None
+
+        if hedge and len(models) >= 2:
+            try:
+                return await self._call_hedged(func, label, models[0], models[1])
+            except Exception as e:
+                last_error = e
+                models = models[2:]
+
+        for name in models:
+            try:
+                return await self._attempt(func, name, label), name
+            except Exception as e:
+                last_error = e
+        if last_error is None:
+            raise AllModelsUnavailable("Все модели временно недоступны (период охлаждения)")
+        raise AllModelsUnavailable(str(last_error))
+
+    async def _call_hedged(self, func, label: str, primary: str, secondary: str):
+        """Запускает основную модель; если она не ответила за hedge_delay — параллельно вторую.
+
+        Побеждает первый успешный ответ, проигравший запрос отменяется.
+        """
+        tasks = {asyncio.ensure_future(self._attempt(func, primary, label)): primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+            hedged = not done
+            if hedged:
+                self.hedges_fired += 1
+                GEMINI_HEDGES.labels("fired").inc()
+                logger.info("Модель %s медлит, запускаем хедж на %s", primary, secondary)
+                tasks[asyncio.ensure_future(self._attempt(func, secondary, label))] = secondary
+
+            pending = set(tasks)
+            last_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        name = tasks[task]
+                        if name == secondary and hedged:
+                            self.hedges_won += 1
+                            GEMINI_HEDGES.labels("won").inc()
+                        return task.result(), name
+                    last_error = task.exception()
+                # Основная модель упала до хеджа — сразу пробуем вторую
+                if not pending and len(tasks) == 1:
+                    task = asyncio.ensure_future(self._attempt(func, secondary, label))
+                    tasks[task] = secondary
+                    pending = {task}
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "models": {
+                name: {**self.breaker(name).stats(), "hedge_delay": round(self.hedge_delay(name), 2)}
+                for name in self.models_priority
+            },
+            "limiter_waits": self.limiter.waits,
+            "hedging": self.hedging,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+        }
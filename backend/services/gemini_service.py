@@ -1,5 +1,82 @@
-import google.generativeai as genai
-from backend.config import GEMINI_API_KEY
+import asyncio
+import json
+import logging
+import re
+from backend.config import GEMINI_API_KEY, SCHEDULE_COMBINED
+from backend.services.gemini_client import GeminiClient, AllModelsUnavailable
+from backend.services.image_processing import prepare_image
+from backend.services.schedule_cache import ScheduleCache
+from backend.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Сетка звонков, общая для промптов распознавания расписания
+SCHEDULE_TIME_RULES = """\
+        ПРАВИЛА ВРЕМЕНИ (СЕТКА ЗВОНКОВ):
+        - Длительность одного урока: 40 минут.
+        - Перемены между уроками:
+          1. После 1-го урока: 5 минут
+          2. После 2-го урока: 10 минут
+          3. После 3-го урока: 10 минут
+          4. После 4-го урока: 15 минут
+          5. После 5-го урока: 10 минут
+          6. После 6-го урока: 10 минут
+        
+        Если в расписании указан только номер урока (например, "1 урок") или только время начала, используй эту сетку для расчета точного времени начала (start) и конца (end).
+        Обычно занятия начинаются в 08:00 или 08:30. Если время начала первого урока на фото другое, адаптируй всю сетку.
+        
+"""
+
+# Ключ кэша для результата, в котором размечены обе группы
+ALL_GROUPS = "all"
+
+
+SHARED_GROUP = "both"
+# Явный номер группы в подписи: "10S-2", "2 группа", "группа 1"
+GROUP_SUFFIX_PATTERNS = (
+    re.compile(r"-(\d)$"),
+    re.compile(r"(\d)\s*груп"),
+    re.compile(r"груп\w*\s*(\d)"),
+)
+
+
+def _entry_group(value) -> str:
+    """Группа записи из поля group: "1", "2", SHARED_GROUP для общей записи или None, если не разобрать.
+
+    Сначала точные значения ("1", "2", "both", "общий", "1, 2", пусто), затем явный номер группы
+    в подписи класса ("10S-2", "группа 2"). Цифры класса ("10", "9O") номером группы не считаются.
+    """
+    label = str(value if value is not None else "").strip().lower()
+    if label in ("1", "2"):
+        return label
+    if label in ("", SHARED_GROUP, ALL_GROUPS, "обе") or label.startswith("общ") or re.fullmatch(r"1\s*(,|и|/|&|\+)\s*2", label):
+        return SHARED_GROUP
+    for pattern in GROUP_SUFFIX_PATTERNS:
+        match = pattern.search(label)
+        if match and match.group(1) in ("1", "2"):
+            return match.group(1)
+    return None
+
+
+def slice_schedule(entries: list, column: str) -> list:
+    """Записи одной группы из общего результата: ее колонка плюс общие для всех ячейки.
+
+    Записи с неразборчивой группой не попадают ни в одну колонку, чтобы не смешивать группы.
+    """
+    result = []
+    skipped = 0
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        entry_group = _entry_group(entry.get("group"))
+        if entry_group is None:
+            skipped += 1
+        elif entry_group in (SHARED_GROUP, column):
+            result.append({k: v for k, v in entry.items() if k != "group"})
+    if skipped:
+        logger.warning("Пропущено записей расписания с неизвестной группой: %d", skipped)
+    return result
+
 
 class GeminiService:
     def __init__(self):
@@ -10,20 +87,92 @@ class GeminiService:
             'gemini-2.0-flash-lite-preview-02-05',
             'gemini-2.0-flash'
         ]
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-        else:
-            print("ВНИМАНИЕ: GEMINI_API_KEY не установлен в .env")
+        self.client = GeminiClient(self.models_priority, self.api_key)
+        self.schedule_cache = ScheduleCache()
+        self._schedule_flight = SingleFlight()
+        if not self.api_key:
+            logger.warning("ВНИМАНИЕ: GEMINI_API_KEY не установлен в .env")
 
     async def recognize_schedule_from_image(self, image_data: bytes, mime_type: str, group: str = ""):
         if not self.api_key:
             return None
-        
+
+        # Уменьшенное серое фото: меньше байт на каждую попытку и быстрее ответ модели
+        image_data, mime_type, phash = await asyncio.to_thread(prepare_image, image_data, mime_type)
+        return await self.recognize_prepared_schedule(image_data, mime_type, phash, group)
+
+    async def recognize_prepared_schedule(self, image_data: bytes, mime_type: str, phash: str, group: str = ""):
+        """Распознавание уже подготовленного prepare_image фото.
+
+        Позволяет вызывающему освободить исходную загрузку до долгих запросов к моделям.
+        """
+        if not self.api_key:
+            return None
+
         # Определяем, какую колонку искать на основе группы
-        group_focus = ""
-        is_group_2 = "2" in group
-        
-        if is_group_2:
+        column = "2" if _entry_group(group) == "2" else "1"
+
+        if SCHEDULE_COMBINED:
+            combined = await self._recognize_both_groups(image_data, mime_type, phash)
+            return slice_schedule(combined, column) if isinstance(combined, list) else combined
+
+        if phash:
+            cached = await self.schedule_cache.get(phash, column)
+            if cached is not None:
+                logger.info("Расписание найдено в кэше (группа %s)", column)
+                return cached
+
+        result = await self._recognize_schedule(self._build_schedule_prompt(group), image_data, mime_type)
+        if phash and isinstance(result, list):
+            await self.schedule_cache.set(phash, column, result)
+        return result
+
+    async def _recognize_both_groups(self, image_data: bytes, mime_type: str, phash: str):
+        """Обе колонки одним запросом; результат общий для всех групп и хранится под ключом ALL_GROUPS."""
+        if phash:
+            cached = await self.schedule_cache.get(phash, ALL_GROUPS)
+            if cached is not None:
+                logger.info("Расписание обеих групп найдено в кэше")
+                return cached
+
+        async def recognize():
+            result = await self._recognize_schedule(self._build_combined_schedule_prompt(), image_data, mime_type)
+            if phash and isinstance(result, list):
+                await self.schedule_cache.set(phash, ALL_GROUPS, result)
+            return result
+
+        if not phash:
+            return await recognize()
+        # Первая и вторая группа, загрузившие одно фото одновременно, ждут один запрос
+        return await self._schedule_flight.do(phash, recognize)
+
+    async def _recognize_schedule(self, prompt: str, image_data: bytes, mime_type: str):
+        async def recognize(model, model_name):
+            response = await model.generate_content_async([
+                prompt,
+                {'mime_type': mime_type, 'data': image_data}
+            ])
+
+            # Очистка от markdown блоков если есть
+            text = response.text.strip()
+            if text.startswith("```json"):
+                text = text[7:-3].strip()
+            elif text.startswith("```"):
+                text = text[3:-3].strip()
+
+            return json.loads(text)
+
+        try:
+            # Без хеджирования: дублировать отправку изображения слишком дорого
+            result, _ = await self.client.call(recognize, "Vision", hedge=False)
+            return result
+        except AllModelsUnavailable as e:
+            logger.error("Распознавание расписания не удалось: %s", e)
+            return None
+
+    def _build_schedule_prompt(self, group: str) -> str:
+        """Промпт для одной группы: модель сама выбирает левую или правую колонку."""
+        if "2" in group:
             group_focus = """
             ВНИМАНИЕ: Пользователь из 2 ГРУППЫ. 
             Твоя задача — игнорировать левую колонку с предметами.
@@ -37,7 +186,7 @@ class GeminiService:
             Если в ячейке написано два предмета, бери тот, что СЛЕВА.
             """
 
-        prompt = f"""
+        return f"""
         Проанализируй это изображение расписания занятий. 
         Группа пользователя: {group if group else "не указана"}.
         {group_focus}
@@ -51,20 +200,7 @@ class GeminiService:
         4. Если ячейка цельная (на всю ширину) — этот предмет общий для обеих групп.
         5. ОШИБКА ЗАПРЕЩЕНА: Не перепутай колонки. Если пользователь во 2-й группе, ты ДОЛЖЕН проигнорировать первый (левый) предмет в строке и взять второй (правый).
 
-        ПРАВИЛА ВРЕМЕНИ (СЕТКА ЗВОНКОВ):
-        - Длительность одного урока: 40 минут.
-        - Перемены между уроками:
-          1. После 1-го урока: 5 минут
-          2. После 2-го урока: 10 минут
-          3. После 3-го урока: 10 минут
-          4. После 4-го урока: 15 минут
-          5. После 5-го урока: 10 минут
-          6. После 6-го урока: 10 минут
-        
-        Если в расписании указан только номер урока (например, "1 урок") или только время начала, используй эту сетку для расчета точного времени начала (start) и конца (end).
-        Обычно занятия начинаются в 08:00 или 08:30. Если время начала первого урока на фото другое, адаптируй всю сетку.
-        
-        СТРУКТУРА РАСПИСАНИЯ:
+{SCHEDULE_TIME_RULES}        СТРУКТУРА РАСПИСАНИЯ:
         1. Дни недели расположены горизонтальными блоками.
         
         2. Колонки групп (КРИТИЧЕСКИ ВАЖНО):
@@ -90,74 +226,113 @@ class GeminiService:
         ]
         Верни ТОЛЬКО массив JSON.
         """
-        
-        for model_name in self.models_priority:
-            try:
-                model = genai.GenerativeModel(model_name)
-                response = await model.generate_content_async([
-                    prompt,
-                    {'mime_type': mime_type, 'data': image_data}
-                ])
-                
-                # Очистка от markdown блоков если есть
-                text = response.text.strip()
-                if text.startswith("```json"):
-                    text = text[7:-3].strip()
-                elif text.startswith("```"):
-                    text = text[3:-3].strip()
-                
-                import json
-                return json.loads(text)
-            except Exception as e:
-                print(f"Ошибка Vision в модели {model_name}: {str(e)}")
-                if "429" in str(e):
-                    print(f"Лимит запросов для {model_name}")
-                elif "403" in str(e):
-                    print(f"Ошибка доступа/API ключа для {model_name}")
-                continue
-        
-        return None
+
+    def _build_combined_schedule_prompt(self) -> str:
+        """Промпт для обеих групп сразу: каждая запись помечена группой, общие ячейки — "both"."""
+        return f"""
+        Проанализируй это изображение расписания занятий.
+        Извлеки список предметов на всю неделю (пн-пт) СРАЗУ ДЛЯ ОБЕИХ ГРУПП.
+
+        ПРАВИЛА РАЗДЕЛЕНИЯ ГРУПП:
+        1. Таблица разделена вертикально на две части для каждой строки.
+        2. ЛЕВАЯ часть ячейки/строки = 1 ГРУППА (10S-1, 9O-1 и т.д.), поле "group": "1".
+        3. ПРАВАЯ часть ячейки/строки = 2 ГРУППА (10S-2, 9O-2 и т.д.), поле "group": "2".
+        4. Если ячейка цельная (на всю ширину) — предмет общий, поле "group": "both". Не дублируй его для каждой группы.
+        5. Если в ячейке написано два предмета (через дробь / или в разных частях ячейки), левый — "1", правый — "2".
+        6. ОШИБКА ЗАПРЕЩЕНА: Не перепутай колонки.
+
+{SCHEDULE_TIME_RULES}        ЗАДАЧА:
+        1. Определи день недели для каждого блока.
+        2. Для каждой строки извлеки предметы обеих колонок: название (title), время (start/end), кабинет (room) и группу (group).
+
+        Верни список предметов в формате JSON:
+        [
+          {{"title": "...", "start": "HH:mm", "end": "HH:mm", "room": "...", "day": "понедельник", "type": "school", "group": "1"}},
+          ...
+        ]
+        Верни ТОЛЬКО массив JSON.
+        """
 
     async def get_response(self, message: str, history: list = []):
+        text, _ = await self.get_response_with_model(message, history)
+        return text
+
+    async def get_response_with_model(self, message: str, history: list = []):
+        """Как get_response, но возвращает (текст, имя модели). При ошибке модель — None."""
+        # Преобразуем историю один раз, а не на каждой попытке
+        return await self.get_response_for_history(message, self.convert_history(history))
+
+    async def get_response_for_history(self, message: str, chat_history: list):
+        """Ответ по истории, уже приведенной к формату Gemini (см. convert_history)."""
         if not self.api_key:
-            return "GEMINI_API_KEY не настроен."
-
-        for model_name in self.models_priority:
-            try:
-                model = genai.GenerativeModel(model_name)
-                # Преобразуем историю в формат Google Generative AI
-                chat_history = []
-                for msg in history:
-                    role = "user" if msg["role"] == "user" else "model"
-                    
-                    # Извлекаем текст из различных возможных форматов сообщения
-                    content = ""
-                    if isinstance(msg.get("content"), str):
-                        content = msg["content"]
-                    elif isinstance(msg.get("parts"), list):
-                        # Собираем текст из всех частей
-                        parts_texts = []
-                        for p in msg["parts"]:
-                            if isinstance(p, dict) and "text" in p:
-                                parts_texts.append(p["text"])
-                            elif isinstance(p, str):
-                                parts_texts.append(p)
-                        content = " ".join(parts_texts)
-                    
-                    if content:
-                        chat_history.append({"role": role, "parts": [content]})
-                
-                chat = model.start_chat(history=chat_history)
-                response = await chat.send_message_async(message)
-                return response.text
-            except Exception as e:
-                print(f"Ошибка Chat в модели {model_name}: {str(e)}")
-                if "429" in str(e):
-                    print(f"Лимит запросов для {model_name}")
-                elif "403" in str(e):
-                    print(f"Ошибка доступа/API ключа для {model_name}")
-                continue
-        
-        return "Извините, возникла ошибка при обработке запроса. Пожалуйста, попробуйте позже."
+            return "GEMINI_API_KEY не настроен.", None
+
+        async def send(model, model_name):
+            chat = model.start_chat(history=chat_history)
+            response = await chat.send_message_async(message)
+            return response.text
+
+        try:
+            return await self.client.call(send, "Chat")
+        except AllModelsUnavailable as e:
+            logger.error("Чат недоступен: %s", e)
+            return "Извините, возникла ошибка при обработке запроса. Пожалуйста, попробуйте позже.", None
+
+    def convert_history(self, history: list) -> list:
+        """Преобразует историю клиента в формат Google Generative AI."""
+        chat_history = []
+        for msg in history:
+            role = "user" if msg["role"] == "user" else "model"
+
+            # Извлекаем текст из различных возможных форматов сообщения
+            content = ""
+            if isinstance(msg.get("content"), str):
+                content = msg["content"]
+            elif isinstance(msg.get("parts"), list):
+                # Собираем текст из всех частей
+                parts_texts = []
+                for p in msg["parts"]:
+                    if isinstance(p, dict) and "text" in p:
+                        parts_texts.append(p["text"])
+                    elif isinstance(p, str):
+                        parts_texts.append(p)
+                content = " ".join(parts_texts)
+
+            if content:
+                chat_history.append({"role": role, "parts": [content]})
+        return chat_history
+
+    async def stream_response(self, message: str, chat_history: list = None):
+        """Потоковая генерация: отдает пары (имя модели, часть текста) по мере генерации.
+
+        chat_history — история в формате convert_history, если ответ продолжает диалог.
+        Переход на следующую модель возможен только до первой полученной части ответа.
+        """
+        if not self.api_key:
+            raise RuntimeError("GEMINI_API_KEY не настроен.")
+
+        contents = message
+        if chat_history:
+            contents = chat_history + [{"role": "user", "parts": [message]}]
+
+        async def generate(model, model_name):
+            response = await model.generate_content_async(contents, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Часть без текста (заблокирована фильтрами безопасности) — пропускаем
+                    logger.warning("Gemini вернул часть ответа без текста (%s)", model_name)
+                    continue
+                if text:
+                    yield text
+
+        stream = self.client.stream(generate, "Stream")
+        try:
+            async for model_name, text in stream:
+                yield model_name, text
+        finally:
+            # Клиент отключился: закрываем поток модели, дальнейшие части ответа не читаем
+            await stream.aclose()
 
 gemini_service = GeminiService()
@@ -0,0 +1,50 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from backend.config import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES,
+    HTTP_BACKOFF, HTTP_BACKOFF_JITTER, HTTP_POOL_SIZE,
+)
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session с таймаутом по умолчанию: библиотеки, которые его не передают, не зависнут навсегда."""
+
+    def __init__(self, timeout: tuple):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        return super().request(method, url, **kwargs)
+
+
+def create_session(pool_size: int = HTTP_POOL_SIZE, retries: int = HTTP_RETRIES,
+                   connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT) -> requests.Session:
+    """Общая сессия с пулом keep-alive соединений, таймаутами и ограниченными повторами с джиттером.
+
+    Повторяются запросы на чтение при обрыве соединения и ответах 5xx. POST тоже: поиск субтитров
+    делает GET страницы видео и POST в innertube player, и этот POST ничего не меняет на сервере.
+    Сессия предназначена только для таких запросов.
+    429 не повторяется: YouTube так сообщает о блокировке, и повторы ее только продлевают.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        backoff_factor=HTTP_BACKOFF,
+        backoff_jitter=HTTP_BACKOFF_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = TimeoutSession((connect_timeout, read_timeout))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,64 @@
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pillow нужен только для подготовки фото расписания; без него изображение уходит в Gemini как есть
+try:
+    from PIL import Image, ImageOps
+    IMAGE_PROCESSING_AVAILABLE = True
+except Exception as e:
+    logger.warning("Pillow не установлен, фото расписаний не сжимаются: %s", e)
+    IMAGE_PROCESSING_AVAILABLE = False
+
+from backend.config import SCHEDULE_IMAGE_MAX_SIDE, SCHEDULE_IMAGE_QUALITY
+
+# 16x16 = 256 бит: расписания одной школы сверстаны по одному шаблону,
+# и 64-битный хэш слишком часто совпадает у разных таблиц
+HASH_SIZE = 16
+
+
+def dhash(image, hash_size: int = HASH_SIZE) -> str:
+    """Разностный перцептивный хэш: устойчив к пересжатию, масштабу и небольшой смене яркости."""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def prepare_image(data: bytes, mime_type: str) -> tuple:
+    """Уменьшает фото, переводит в оттенки серого и перекодирует в JPEG.
+
+    Возвращает (байты, mime_type, перцептивный хэш). Если изображение не удалось
+    разобрать, возвращает исходные байты и хэш None — кэш для такого фото не используется.
+    data может быть bytearray; исходные данные копируются в bytes, только если уходят в модель как есть.
+    """
+    if not IMAGE_PROCESSING_AVAILABLE:
+        return bytes(data), mime_type, None
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # Фото с телефона часто повернуты только через EXIF
+            image = ImageOps.exif_transpose(source).convert("L")
+        image.thumbnail((SCHEDULE_IMAGE_MAX_SIDE, SCHEDULE_IMAGE_MAX_SIDE), Image.LANCZOS)
+        phash = dhash(image)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=SCHEDULE_IMAGE_QUALITY, optimize=True)
+        prepared = buffer.getvalue()
+    except Exception as e:
+        logger.warning("Не удалось подготовить изображение, отправляем как есть: %s", e)
+        return bytes(data), mime_type, None
+
+    # Маленький PNG-скриншот может оказаться меньше перекодированного JPEG
+    if len(prepared) >= len(data):
+        return bytes(data), mime_type, phash
+    logger.info("Изображение сжато: %d -> %d байт (%dx%d)", len(data), len(prepared), *image.size)
+    return prepared, "image/jpeg", phash
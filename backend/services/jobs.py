@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.config import JOB_WORKERS, JOB_MAX_STORED, JOB_RESULT_TTL
+
+logger = logging.getLogger(__name__)
+
+# Статусы фоновой задачи
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+
+class Job:
+    def __init__(self, kind: str, payload: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = STATUS_QUEUED
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def set_stage(self, stage: str, data: dict = None):
+        """Колбэк прогресса: вызывается сервисами (в том числе из рабочих потоков)."""
+        self.stage = stage
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Очередь фоновых задач: тяжелая работа выполняется в ограниченном пуле потоков вне event loop."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_stored: int = JOB_MAX_STORED, result_ttl: int = JOB_RESULT_TTL):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self.max_stored = max_stored
+        self.result_ttl = result_ttl
+        self.handlers = {}
+        self.jobs = OrderedDict()
+        # event loop хранит на задачи только слабые ссылки: без этого набора задача может быть собрана сборщиком мусора
+        self._tasks = set()
+
+    def register(self, kind: str, handler):
+        """Регистрирует обработчик: async def handler(payload, progress) -> dict."""
+        self.handlers[kind] = handler
+
+    async def run_blocking(self, func, *args):
+        """Выполняет синхронную функцию в пуле воркеров, не блокируя event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def submit(self, kind: str, payload: dict) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+        self._cleanup()
+        job = Job(kind, payload)
+        self.jobs[job.id] = job
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float):
+        """Long-poll: ждет завершения задачи не дольше timeout секунд."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if timeout > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _run(self, job: Job):
+        job.status = STATUS_RUNNING
+        job.stage = "started"
+        try:
+            job.result = await self.handlers[job.kind](job.payload, job.set_stage)
+            job.status = STATUS_DONE
+            job.stage = "done"
+        except Exception as e:
+            logger.error("Ошибка в задаче %s (%s): %s", job.id, job.kind, e)
+            job.status = STATUS_ERROR
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    def _cleanup(self):
+        """Удаляет устаревшие результаты и ограничивает число хранимых задач."""
+        now = time.time()
+        for job_id in list(self.jobs):
+            job = self.jobs[job_id]
+            if job.finished_at and now - job.finished_at > self.result_ttl:
+                del self.jobs[job_id]
+
+        while len(self.jobs) >= self.max_stored:
+            # Сначала вытесняем самые старые завершенные задачи
+            finished = next((jid for jid, j in self.jobs.items() if j.done.is_set()), None)
+            if finished is None:
+                break
+            del self.jobs[finished]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.config import MODELS_CPP_DIR, WHISPER_MODEL_SIZE, WHISPER_POOL_SIZE, WHISPER_N_THREADS, WHISPER_IDLE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _load_model(n_threads: int):
+    from pywhispercpp.model import Model
+    return Model(WHISPER_MODEL_SIZE, models_dir=MODELS_CPP_DIR, n_threads=n_threads)
+
+
+class WhisperModelPool:
+    """Пул загруженных моделей Whisper.
+
+    Каждый экземпляр в каждый момент используется только одним потоком.
+    Простаивающие дольше idle_ttl экземпляры выгружаются, чтобы освободить память.
+    """
+
+    def __init__(self, size: int = WHISPER_POOL_SIZE, n_threads: int = WHISPER_N_THREADS,
+                 idle_ttl: float = WHISPER_IDLE_TTL, loader=None):
+        self.size = max(1, size)
+        self.n_threads = n_threads
+        self.idle_ttl = idle_ttl
+        self._loader = loader or _load_model
+        self._idle = []   # (модель, время последнего использования)
+        self._total = 0   # Загруженные экземпляры: свободные + выданные
+        self._cond = threading.Condition()
+        self._reaper = None
+        # Пул процессов параллельной транскрибации: тоже держит модели и выгружается тем же потоком
+        self.parallel = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.last_load_seconds = None
+
+    def _load(self):
+        logger.info("Загрузка модели Whisper (%s, n_threads=%d)...", WHISPER_MODEL_SIZE, self.n_threads)
+        started = time.time()
+        model = self._loader(self.n_threads)
+        elapsed = time.time() - started
+        with self._cond:
+            self.loads += 1
+            self.load_seconds += elapsed
+            self.last_load_seconds = elapsed
+        logger.info("Модель загружена за %.1f сек.", elapsed)
+        return model
+
+    def _reserve_slot(self) -> bool:
+        with self._cond:
+            if self._total >= self.size:
+                return False
+            self._total += 1
+            return True
+
+    def _release_slot(self):
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def preload(self, count: int = None):
+        """Заранее загружает count экземпляров (по умолчанию весь пул)."""
+        count = self.size if count is None else min(count, self.size)
+        for _ in range(count):
+            if not self._reserve_slot():
+                break
+            try:
+                model = self._load()
+            except Exception as e:
+                logger.error("Не удалось предзагрузить модель Whisper: %s", e)
+                self._release_slot()
+                break
+            with self._cond:
+                self._idle.append((model, time.time()))
+                self._cond.notify()
+
+    @contextmanager
+    def checkout(self, timeout: float = None):
+        """Выдает свободную модель; если все заняты и пул полон — ждет возврата."""
+        model = None
+        deadline = time.time() + timeout if timeout else None
+        with self._cond:
+            while True:
+                if self._idle:
+                    model, _ = self._idle.pop()
+                    self.hits += 1
+                    break
+                if self._total < self.size:
+                    self._total += 1
+                    self.misses += 1
+                    break
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Нет свободной модели Whisper")
+                self._cond.wait(remaining)
+
+        if model is None:
+            try:
+                model = self._load()
+            except Exception:
+                self._release_slot()
+                raise
+
+        try:
+            yield model
+        finally:
+            with self._cond:
+                self._idle.append((model, time.time()))
+                self._cond.notify()
+
+    def evict_idle(self):
+        """Выгружает экземпляры, которые простаивали дольше idle_ttl."""
+        now = time.time()
+        with self._cond:
+            keep = []
+            for model, last_used in self._idle:
+                if now - last_used > self.idle_ttl:
+                    self._total -= 1
+                    self.evictions += 1
+                else:
+                    keep.append((model, last_used))
+            evicted = len(self._idle) - len(keep)
+            self._idle = keep
+            if evicted:
+                self._cond.notify_all()
+        if evicted:
+            logger.info("Выгружено простаивающих моделей Whisper: %d", evicted)
+
+    def start_reaper(self, interval: float = None):
+        """Фоновый поток, периодически выгружающий простаивающие модели."""
+        if self._reaper is not None or not self.idle_ttl:
+            return
+        interval = interval or max(self.idle_ttl / 2, 10)
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.evict_idle()
+                if self.parallel is not None:
+                    self.parallel.evict_idle()
+
+        self._reaper = threading.Thread(target=loop, name="whisper-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "loaded": self._total,
+                "idle": len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loads": self.loads,
+                "load_seconds_total": round(self.load_seconds, 3),
+                "last_load_seconds": round(self.last_load_seconds, 3) if self.last_load_seconds is not None else None,
+                "parallel": self.parallel.stats() if self.parallel is not None else None,
+            }
@@ -0,0 +1,241 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from backend.config import (
+    MODELS_CPP_DIR, WHISPER_MODEL_SIZE, AUDIO_SAMPLE_RATE,
+    WHISPER_PARALLEL_WORKERS, WHISPER_CHUNK_SECONDS, WHISPER_CHUNK_OVERLAP_SECONDS, WHISPER_IDLE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Модель, которая живет в каждом процессе-воркере все время его жизни
+_worker_model = None
+
+
+def _init_worker(model_size: str, models_dir: str, n_threads: int):
+    """Инициализатор процесса: загружает модель один раз на воркер."""
+    global _worker_model
+    from pywhispercpp.model import Model
+    _worker_model = Model(model_size, models_dir=models_dir, n_threads=n_threads)
+
+
+def _worker_pid() -> int:
+    """Пустая задача для прогрева: выполняется, когда инициализатор воркера уже загрузил модель."""
+    return os.getpid()
+
+
+def _transcribe_chunk(start: int, nominal_end: int, audio: np.ndarray) -> list:
+    """Транскрибирует один фрагмент и переводит таймкоды в секунды от начала всего аудио."""
+    offset = start / AUDIO_SAMPLE_RATE
+    limit = nominal_end / AUDIO_SAMPLE_RATE
+    result = []
+    for s in _worker_model.transcribe(audio):
+        # pywhispercpp отдает время в сотых долях секунды
+        seg_start = offset + s.t0 / 100.0
+        seg_end = offset + s.t1 / 100.0
+        # Сегменты, начавшиеся в зоне перекрытия, принадлежат следующему фрагменту
+        if seg_start >= limit:
+            continue
+        result.append((seg_start, seg_end, s.text.strip()))
+    return result
+
+
+def frame_energy(audio: np.ndarray, frame_size: int) -> np.ndarray:
+    """RMS-энергия по кадрам фиксированной длины."""
+    n_frames = len(audio) // frame_size
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * frame_size].reshape(n_frames, frame_size)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def find_split_points(audio: np.ndarray, chunk_seconds: float, search_seconds: float = 5.0, frame_ms: int = 30) -> list:
+    """Простой энергетический VAD: режем рядом с целевой границей в самом тихом кадре."""
+    sr = AUDIO_SAMPLE_RATE
+    frame_size = int(sr * frame_ms / 1000)
+    energy = frame_energy(audio, frame_size)
+    total = len(audio)
+    chunk = int(chunk_seconds * sr)
+    search = int(search_seconds * sr) // frame_size
+
+    points = []
+    target = chunk
+    while target < total - chunk // 4:
+        center = target // frame_size
+        lo = max(center - search, 0)
+        hi = min(center + search + 1, len(energy))
+        if hi > lo:
+            split = (lo + int(np.argmin(energy[lo:hi]))) * frame_size
+        else:
+            split = target
+        if points and split <= points[-1]:
+            split = target
+        points.append(split)
+        target = split + chunk
+    return points
+
+
+def stitch_segments(chunks: list) -> list:
+    """Склеивает сегменты по порядку и убирает дубли на границах фрагментов."""
+    result = []
+    for segments in chunks:
+        for start, end, text in segments:
+            if not text:
+                continue
+            if result:
+                prev_start, prev_end, prev_text = result[-1]
+                # Повтор той же фразы на стыке фрагментов
+                if text.lower() == prev_text.lower() and start < prev_end + 1.0:
+                    continue
+                # Сегмент целиком внутри уже распознанного интервала
+                if end <= prev_end:
+                    continue
+            result.append((start, end, text))
+    return result
+
+
+class ParallelTranscriber:
+    """Параллельная транскрибация: аудио режется по паузам и распознается в пуле процессов.
+
+    Каждый процесс держит свою модель, поэтому пул, простаивающий дольше idle_ttl,
+    останавливается целиком (evict_idle вызывает фоновый поток WhisperModelPool).
+    """
+
+    def __init__(self, workers: int = WHISPER_PARALLEL_WORKERS, chunk_seconds: float = WHISPER_CHUNK_SECONDS,
+                 overlap_seconds: float = WHISPER_CHUNK_OVERLAP_SECONDS, idle_ttl: float = WHISPER_IDLE_TTL):
+        self.workers = max(1, workers)
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.idle_ttl = idle_ttl
+        self._pool = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_used = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.failures = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Вызывается под self._lock
+        if self._pool is not None:
+            self.hits += 1
+            return self._pool
+
+        self.misses += 1
+        self.loads += 1
+        n_threads = max(1, (multiprocessing.cpu_count() or 1) // self.workers)
+        logger.info("Запуск пула Whisper: %d процессов по %d потоков", self.workers, n_threads)
+        # spawn: форк процесса с потоками uvicorn небезопасен
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(WHISPER_MODEL_SIZE, MODELS_CPP_DIR, n_threads),
+        )
+        return self._pool
+
+    def prewarm(self):
+        """Запускает пул и ждет, пока воркеры загрузят модель: первый запрос не платит за spawn и загрузку."""
+        with self._lock:
+            pool = self._get_pool()
+            self._last_used = time.time()
+        # Процессы создаются по мере отправки задач — по пустой задаче на воркер
+        try:
+            pids = {f.result() for f in [pool.submit(_worker_pid) for _ in range(self.workers)]}
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+        logger.info("Пул Whisper прогрет: готово процессов %d из %d", len(pids), self.workers)
+
+    def split(self, audio: np.ndarray) -> list:
+        """Возвращает список (start, nominal_end, end) в сэмплах; end включает перекрытие."""
+        points = find_split_points(audio, self.chunk_seconds)
+        overlap = int(self.overlap_seconds * AUDIO_SAMPLE_RATE)
+        bounds = [0] + points + [len(audio)]
+        return [
+            (bounds[i], bounds[i + 1], min(bounds[i + 1] + overlap, len(audio)))
+            for i in range(len(bounds) - 1)
+        ]
+
+    def transcribe(self, audio: np.ndarray, progress=None) -> list:
+        """Возвращает список сегментов (start_sec, end_sec, text) в исходном порядке.
+
+        progress(stage, data) получает сегменты каждого фрагмента по мере готовности (по порядку).
+        """
+        with self._lock:
+            pool = self._get_pool()
+            self._active += 1
+        try:
+            return self._transcribe(pool, audio, progress)
+        except BrokenProcessPool:
+            # Воркер упал (например, убит по памяти) — пул непригоден, следующий запрос поднимет новый
+            self._discard(pool)
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_used = time.time()
+
+    def _transcribe(self, pool: ProcessPoolExecutor, audio: np.ndarray, progress) -> list:
+        ranges = self.split(audio)
+        logger.info("Аудио разбито на %d фрагментов", len(ranges))
+        futures = [
+            pool.submit(_transcribe_chunk, start, nominal_end, audio[start:end])
+            for start, nominal_end, end in ranges
+        ]
+        results = []
+        for f in futures:
+            segments = f.result()
+            results.append(segments)
+            if progress:
+                for start, end, text in segments:
+                    progress("segment", {"start": start, "end": end, "text": text})
+        return stitch_segments(results)
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self.failures += 1
+        logger.error("Пул процессов Whisper сломан и будет перезапущен")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def evict_idle(self):
+        """Останавливает пул процессов (и их модели), если он простаивал дольше idle_ttl."""
+        with self._lock:
+            if self._pool is None or self._active or time.time() - self._last_used <= self.idle_ttl:
+                return
+            pool, self._pool = self._pool, None
+            self.evictions += 1
+        pool.shutdown(wait=False)
+        logger.info("Пул процессов Whisper остановлен после простоя")
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._pool is not None,
+                "active": self._active,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loads": self.loads,
+                "failures": self.failures,
+            }
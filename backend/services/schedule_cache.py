@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+from backend.config import (
+    SCHEDULE_CACHE_DIR, SCHEDULE_CACHE_TTL, SCHEDULE_CACHE_MEMORY_ENTRIES,
+    SCHEDULE_CACHE_MAX_BYTES, SCHEDULE_HASH_MAX_DISTANCE,
+)
+from backend.services.cache import TwoTierCache
+from backend.services.image_processing import hamming_distance
+
+# Версия промпта распознавания: увеличивайте при его изменении, чтобы не отдавать старые результаты
+SCHEDULE_PROMPT_VERSION = "1"
+
+
+class ScheduleCache:
+    """Кэш распознанных расписаний по перцептивному хэшу фото и группе.
+
+    Точное совпадение хэша ищется в TwoTierCache. Для пересжатых копий того же фото
+    (пересланных через мессенджер) хэш отличается на несколько бит — их находит
+    поиск ближайшего хэша среди недавно сохраненных. get/set — корутины: диск читается
+    и пишется вне event loop.
+    """
+
+    def __init__(self, max_distance: int = SCHEDULE_HASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.cache = TwoTierCache(
+            SCHEDULE_CACHE_DIR,
+            max_entries=SCHEDULE_CACHE_MEMORY_ENTRIES,
+            max_bytes=SCHEDULE_CACHE_MAX_BYTES,
+            ttl=SCHEDULE_CACHE_TTL,
+            name="schedule",
+        )
+        # Недавние хэши по группам для поиска ближайшего; размер как у кэша в памяти
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.near_hits = 0
+
+    def _key(self, phash: str, group: str) -> str:
+        return f"schedule:v{SCHEDULE_PROMPT_VERSION}:{group}:{phash}"
+
+    def _remember(self, phash: str, group: str):
+        with self._lock:
+            self._recent[(group, phash)] = True
+            self._recent.move_to_end((group, phash))
+            while len(self._recent) > SCHEDULE_CACHE_MEMORY_ENTRIES:
+                self._recent.popitem(last=False)
+
+    def _nearest(self, phash: str, group: str):
+        with self._lock:
+            candidates = [h for g, h in self._recent if g == group and h != phash]
+        best, best_distance = None, self.max_distance + 1
+        for candidate in candidates:
+            distance = hamming_distance(phash, candidate)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    async def get(self, phash: str, group: str):
+        result = await self.cache.aget(self._key(phash, group))
+        if result is not None:
+            self._remember(phash, group)
+            return result
+
+        nearest = self._nearest(phash, group)
+        if nearest is None:
+            return None
+        result = await self.cache.aget(self._key(nearest, group))
+        if result is not None:
+            self.near_hits += 1
+        return result
+
+    async def set(self, phash: str, group: str, result):
+        await self.cache.aset(self._key(phash, group), result)
+        self._remember(phash, group)
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "near_hits": self.near_hits, "indexed_hashes": len(self._recent)}
@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from backend.config import (
+    TEMP_DIR, AUDIO_SAMPLE_RATE, SCRATCH_DIR, SCRATCH_TMPFS, SCRATCH_QUOTA_BYTES, SCRATCH_DEFAULT_JOB_BYTES,
+    SCRATCH_WAIT_TIMEOUT, SCRATCH_ORPHAN_TTL, SCRATCH_SWEEP_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+TMPFS_DIR = "/dev/shm"
+# Файлы старых версий, которые писали загрузки прямо в TEMP_DIR: <uuid>.<ext> и <uuid>_16k.wav
+LEGACY_FILE_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(_16k)?\.\w+$")
+
+
+def estimate_audio_bytes(info: dict) -> int:
+    """Сколько места займет загрузка: исходный аудиофайл плюс WAV 16 кГц моно после ffmpeg."""
+    duration = info.get("duration")
+    if not duration:
+        return SCRATCH_DEFAULT_JOB_BYTES
+    source = info.get("filesize") or info.get("filesize_approx") or duration * 16 * 1024
+    return int(source + duration * AUDIO_SAMPLE_RATE * 2)
+
+
+class ScratchJob:
+    """Директория одной загрузки. Создается при первом резервировании и удаляется целиком при close(),
+    вместе с недокачанными файлами."""
+
+    def __init__(self, space, name: str):
+        self.space = space
+        self.path = os.path.join(space.root, name)
+        self.reserved = 0
+        self.closed = False
+
+    def reserve(self, nbytes: int, timeout: float = SCRATCH_WAIT_TIMEOUT, cancel=None):
+        """Резервирует место под файлы задачи; при заполненной квоте ждет, пока другие задачи освободят место."""
+        self.space._acquire(nbytes, timeout, cancel)
+        self.reserved += nbytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.space._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ScratchSpace:
+    """Временные файлы загрузок с общей квотой в байтах.
+
+    Каждая задача получает свою директорию и резервирует место до начала загрузки.
+    Если квота исчерпана, новые загрузки ждут (backpressure), а не переполняют диск.
+    Фоновый поток удаляет директории и файлы, брошенные упавшими или убитыми процессами.
+    """
+
+    def __init__(self, root: str = SCRATCH_DIR, quota_bytes: int = SCRATCH_QUOTA_BYTES,
+                 orphan_ttl: float = SCRATCH_ORPHAN_TTL, tmpfs: bool = SCRATCH_TMPFS):
+        if tmpfs:
+            if os.path.isdir(TMPFS_DIR):
+                root = os.path.join(TMPFS_DIR, "focus-point-scratch")
+            else:
+                logger.warning("%s недоступен, временные файлы пишутся в %s", TMPFS_DIR, root)
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.orphan_ttl = orphan_ttl
+        os.makedirs(self.root, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._used = 0
+        self._jobs = set()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+        self.waits = 0
+        self.rejected = 0
+        self.swept = 0
+
+    def open_job(self) -> ScratchJob:
+        # PID в имени: несколько воркеров uvicorn могут делить одну директорию
+        job = ScratchJob(self, f"job-{os.getpid()}-{uuid.uuid4().hex}")
+        with self._cond:
+            self._jobs.add(job.path)
+        return job
+
+    def _acquire(self, nbytes: int, timeout: float, cancel=None):
+        if nbytes > self.quota_bytes:
+            with self._cond:
+                self.rejected += 1
+            raise TimeoutError(f"Загрузке нужно {nbytes // (1024 * 1024)} МБ, больше всей квоты временных файлов")
+
+        deadline = time.time() + timeout if timeout else None
+        with self._cond:
+            if self._used + nbytes > self.quota_bytes:
+                self.waits += 1
+                logger.info("Квота временных файлов заполнена, загрузка ждет %d МБ", nbytes // (1024 * 1024))
+            while self._used + nbytes > self.quota_bytes:
+                if cancel is not None and cancel.is_set():
+                    raise TimeoutError("Ожидание места отменено")
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    self.rejected += 1
+                    raise TimeoutError("Нет места для временных файлов")
+                # Короткие ожидания, чтобы заметить отмену
+                self._cond.wait(min(remaining, 1.0) if remaining is not None else 1.0)
+            self._used += nbytes
+
+    def _release(self, job: ScratchJob):
+        with self._cond:
+            self._used -= job.reserved
+            self._jobs.discard(job.path)
+            self._cond.notify_all()
+
+    def sweep(self):
+        """Удаляет директории задач и старые файлы загрузок, которые никто не использует дольше orphan_ttl."""
+        cutoff = time.time() - self.orphan_ttl
+        with self._cond:
+            active = set(self._jobs)
+
+        candidates = []
+        for directory, pattern in ((self.root, None), (TEMP_DIR, LEGACY_FILE_RE)):
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if pattern is not None and not (entry.is_file() and pattern.match(entry.name)):
+                            continue
+                        candidates.append(entry)
+            except FileNotFoundError:
+                continue
+
+        removed = 0
+        for entry in candidates:
+            if entry.path in active:
+                continue
+            try:
+                if entry.stat().st_mtime > cutoff:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            with self._cond:
+                self.swept += removed
+            logger.info("Удалено брошенных временных файлов: %d", removed)
+
+    def start_sweeper(self, interval: float = SCRATCH_SWEEP_INTERVAL):
+        """Фоновый поток уборки; первый проход сразу — после перезапуска остаются файлы прошлого процесса."""
+        if self._sweeper is not None:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error("Ошибка уборки временных файлов: %s", e)
+                self._stop.wait(interval)
+
+        self._sweeper = threading.Thread(target=loop, name="scratch-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "root": self.root,
+                "quota_bytes": self.quota_bytes,
+                "reserved_bytes": self._used,
+                "jobs": len(self._jobs),
+                "waits": self.waits,
+                "rejected": self.rejected,
+                "swept": self.swept,
+            }
@@ -0,0 +1,34 @@
+import asyncio
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в одну общую задачу.
+
+    Первый вызов запускает работу, остальные ждут тот же результат.
+    Отмена ожидающего не отменяет общую задачу.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.shared = 0  # Сколько вызовов получили результат чужой задачи
+
+    async def do(self, key: str, factory):
+        """factory — функция без аргументов, возвращающая корутину/awaitable."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Забираем исключение, чтобы не было предупреждений, если все ожидающие отменились
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
@@ -1,10 +1,41 @@
 import re
+import asyncio
+import hashlib
+import logging
 from collections import Counter
+from backend import text_engine
+from backend.metrics import span
+from backend.services.cache import TwoTierCache
 from backend.services.gemini_service import gemini_service
+from backend.services.singleflight import SingleFlight
+from backend.services.textrank import TEXTRANK_AVAILABLE, textrank_scores, select_sentences
+from backend.config import (
+    SUMMARY_CACHE_DIR, SUMMARY_CACHE_TTL, SUMMARY_CACHE_LOCAL_TTL,
+    SUMMARY_CACHE_MEMORY_ENTRIES, SUMMARY_CACHE_MAX_BYTES,
+    SUMMARY_LONG_TEXT_TOKENS, SUMMARY_CHUNK_TOKENS, SUMMARY_MAP_CONCURRENCY, SUMMARY_MAX_MAP_PASSES,
+    SUMMARY_EXTRACTIVE_MAX_CHARS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Версия шаблона промпта: увеличивайте при любом изменении промпта, чтобы не отдавать старые конспекты из кэша
+PROMPT_VERSION = "2"
+# Ключ модели для конспектов локального суммаризатора (их можно улучшить позже, когда Gemini снова доступен)
+LOCAL_MODEL = "local"
+# Грубая оценка: сколько символов русского текста приходится на один токен
+CHARS_PER_TOKEN = 3
 
 class SummarizationService:
     def __init__(self):
-        print("Инициализация интеллектуальной суммаризации (Knowledge Extractor)...")
+        logger.info("Инициализация интеллектуальной суммаризации (Knowledge Extractor)...")
+        self._flight = SingleFlight()
+        self.cache = TwoTierCache(
+            SUMMARY_CACHE_DIR,
+            max_entries=SUMMARY_CACHE_MEMORY_ENTRIES,
+            max_bytes=SUMMARY_CACHE_MAX_BYTES,
+            ttl=SUMMARY_CACHE_TTL,
+            name="summary",
+        )
         # Стоп-слова (расширенный набор для фильтрации математики)
         self.stop_words = set([
             "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а", "то", "все", "она", 
@@ -27,60 +58,242 @@ class SummarizationService:
         return [w for w, c in counts.most_common(top_n)]
 
     def _clean_text(self, text):
-        # Удаляем приветствия и типичные вступления блогеров
-        intro_patterns = [
-            r'здравствуйте\s+ребята', r'всем\s+привет', r'с\s+вами\s+реальные\s+венатор',
-            r'сегодня\s+на\s+уроке', r'мы\s+разберем', r'добро\s+пожаловать',
-            r'подписывайтесь\s+на\s+канал', r'ставьте\s+лайки'
-        ]
-        
-        cleaned = text
-        for pattern in intro_patterns:
-            cleaned = re.sub(pattern, '', cleaned, flags=re.I)
-            
-        # Исправляем базовую пунктуацию (пробелы перед знаками и т.д.)
-        cleaned = re.sub(r'\s+([.,!?])', r'\1', cleaned)
-        cleaned = re.sub(r'([.,!?])(?=[^\s])', r'\1 ', cleaned)
-        
-        return cleaned.strip()
+        # Удаляем приветствия блогеров и исправляем базовую пунктуацию
+        return text_engine.normalize_transcript(text)
 
     def _is_math_noise(self, text):
-        # Паттерны для обнаружения чисто арифметических вычислений и координат
-        math_patterns = [
-            r'\d+\s*(?:плюс|минус|умножить|разделить|равно|равняется|получится|в\s+степени|в\s+квадрате)',
-            r'(?:плюс|минус|умножить|разделить|равно|равняется|получится)\s*\d+',
-            r'\d+\s*[+\-*/=]\s*\d+',
-            r'икс\s+равно', r'игрек\s+равно', r'зед\s+равно',
-            r'результате\s+у\s+нас\s+получится',
-            r'это\s+будет\s+минус\s+\d+',
-            r'вершина\s+параболы\s+у\s+нас\s+будет',
-            r'\d+\s+умножить\s+на\s+\d+',
-            r'квадрате\s+минус\s+\d+',
-            r'\d+\s+и\s+минус\s+\d+', # Паттерн "3 и минус 4"
-            r'точку\s+нашли', r'координаты', r'ось\s+икс', r'ось\s+игрек'
-        ]
-        
-        text_lower = text.lower()
-        
-        # Если в предложении слишком много цифр по отношению к буквам - это скорее всего расчет
-        digits = len(re.findall(r'\d', text))
-        letters = len(re.findall(r'[а-яё]', text_lower))
-        if digits > 0 and letters > 0 and (digits / letters) > 0.3:
-            return True
-
-        matches = 0
-        for pattern in math_patterns:
-            if re.search(pattern, text_lower):
-                matches += 1
-        
-        return matches >= 1
+        return text_engine.is_math_noise(text)
 
     async def summarize_with_ai(self, text: str) -> dict:
         """Создает конспект с помощью Gemini AI."""
         if not text or len(text.strip()) < 50:
             return {"title": "Короткий текст", "summary": "Текст слишком короткий для полноценного конспекта."}
 
-        prompt = f"""
+        with span("summarization"):
+            text_hash = self._text_hash(text)
+            with span("summary_cache"):
+                cached = await self._get_cached(text_hash, gemini_service.models_priority)
+            if cached:
+                logger.info("Конспект найден в кэше (модель: %s).", cached['model'])
+                return {"title": cached["title"], "summary": cached["summary"]}
+
+            # Одинаковые тексты, пришедшие одновременно, суммаризируются одним запросом к Gemini
+            return await self._flight.do(text_hash, lambda: self._summarize_with_ai(text, text_hash))
+
+    def _text_hash(self, text: str) -> str:
+        """Хэш нормализованного текста: различия в пробелах и переносах не влияют на ключ."""
+        normalized = re.sub(r'\s+', ' ', text).strip()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _cache_key(self, text_hash: str, model: str) -> str:
+        return f"summary:v{PROMPT_VERSION}:{model}:{text_hash}"
+
+    async def _get_cached(self, text_hash: str, models: list):
+        for model in models:
+            cached = await self.cache.aget(self._cache_key(text_hash, model))
+            if cached:
+                return cached
+        return None
+
+    async def _store(self, text_hash: str, model: str, result: dict):
+        ttl = SUMMARY_CACHE_LOCAL_TTL if model == LOCAL_MODEL else SUMMARY_CACHE_TTL
+        await self.cache.aset(self._cache_key(text_hash, model), {
+            "model": model,
+            "title": result["title"],
+            "summary": result["summary"],
+        }, ttl=ttl)
+
+    async def _summarize_locally(self, text: str, text_hash: str) -> dict:
+        """Локальный конспект с отдельным ключом кэша."""
+        cached = await self._get_cached(text_hash, [LOCAL_MODEL])
+        if cached:
+            return {"title": cached["title"], "summary": cached["summary"]}
+        with span("summarize_local"):
+            result = self.summarize(text)
+        await self._store(text_hash, LOCAL_MODEL, result)
+        return result
+
+    async def _summarize_with_ai(self, text: str, text_hash: str) -> dict:
+        try:
+            prompt = await self._prepare_prompt(text)
+            with span("gemini"):
+                response, model_name = await gemini_service.get_response_with_model(prompt)
+            if model_name is None or "Ошибка:" in response or "К сожалению" in response:
+                logger.warning("Gemini вернул ошибку, используем локальный суммаризатор. Ошибка: %s", response)
+                return await self._summarize_locally(text, text_hash)
+
+            result = self._parse_response(response, text)
+            await self._store(text_hash, model_name, result)
+            return result
+        except Exception as e:
+            logger.error("Ошибка при вызове Gemini: %s. Используем локальный суммаризатор.", e)
+            return await self._summarize_locally(text, text_hash)
+
+    async def stream_with_ai(self, text: str):
+        """Потоковый конспект: события ("chunk", часть текста) и в конце ("result", {"title", "summary"}).
+
+        Если Gemini упал до первой части, результатом будет локальный конспект. Если после —
+        клиент уже показал часть ответа, и вместо подмены конспекта приходит ("error", {"detail"}).
+        """
+        if not text or len(text.strip()) < 50:
+            yield "result", {"title": "Короткий текст", "summary": "Текст слишком короткий для полноценного конспекта."}
+            return
+
+        text_hash = self._text_hash(text)
+        cached = await self._get_cached(text_hash, gemini_service.models_priority)
+        if cached:
+            yield "result", {"title": cached["title"], "summary": cached["summary"]}
+            return
+
+        parts = []
+        model_name = None
+        try:
+            prompt = await self._prepare_prompt(text)
+            async for model_name, chunk in gemini_service.stream_response(prompt):
+                parts.append(chunk)
+                yield "chunk", chunk
+        except Exception as e:
+            if parts:
+                logger.error("Поток Gemini оборвался после %d частей: %s", len(parts), e)
+                yield "error", {"detail": f"Генерация конспекта прервалась: {e}"}
+                return
+            logger.error("Ошибка потоковой генерации Gemini: %s. Используем локальный суммаризатор.", e)
+            yield "result", await self._summarize_locally(text, text_hash)
+            return
+
+        response = "".join(parts)
+        if model_name is None or not response.strip():
+            # Поток завершился без текста (например, все части заблокированы) — как и без потока,
+            # отдаем локальный конспект, а не пустой результат в кэше
+            logger.warning("Gemini не вернул текст конспекта, используем локальный суммаризатор.")
+            yield "result", await self._summarize_locally(text, text_hash)
+            return
+
+        result = self._parse_response(response, text)
+        await self._store(text_hash, model_name, result)
+        yield "result", result
+
+    def _parse_response(self, response: str, text: str) -> dict:
+        """Первая строка ответа — название, остальное — конспект."""
+        lines = response.strip().split('\n')
+        title = lines[0].strip().strip('#').strip('*').strip()
+        summary = '\n'.join(lines[1:]).strip()
+
+        if not summary: # Если ИИ не разделил на строки
+            summary = response
+            title = self._extract_keywords(text)[0].capitalize() if self._extract_keywords(text) else "Конспект видео"
+
+        return {"title": title, "summary": summary}
+
+    def _estimate_tokens(self, text: str) -> int:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+    def _split_chunks(self, text: str, max_tokens: int) -> list:
+        """Режет текст на части по границам предложений в пределах бюджета токенов."""
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        chunks = []
+        current = []
+        size = 0
+        for sentence in re.split(r'(?<=[.!?])\s+', text):
+            # Субтитры бывают без пунктуации: слишком длинное "предложение" режем по пробелам
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces, sentence = sentence[:cut], sentence[cut:].lstrip()
+                if current:
+                    chunks.append(' '.join(current))
+                    current, size = [], 0
+                chunks.append(pieces)
+            if size + len(sentence) > max_chars and current:
+                chunks.append(' '.join(current))
+                current, size = [], 0
+            if sentence:
+                current.append(sentence)
+                size += len(sentence) + 1
+        if current:
+            chunks.append(' '.join(current))
+        return chunks
+
+    async def _prepare_prompt(self, text: str) -> str:
+        """Короткий текст — один промпт. Длинный — map-этап по частям и промпт для reduce-этапа."""
+        if self._estimate_tokens(text) <= SUMMARY_LONG_TEXT_TOKENS:
+            return self._build_prompt(text)
+
+        chunks = self._split_chunks(text, SUMMARY_CHUNK_TOKENS)
+        logger.info("Длинный транскрипт: map-reduce по %d частям", len(chunks))
+        with span("summary_map"):
+            partials = await self._map_chunks(chunks)
+
+            # Если частичные конспекты все еще не помещаются, сжимаем их еще одним map-этапом.
+            # Число проходов ограничено: если модель не сокращает текст, reduce получает то, что есть
+            tokens = self._estimate_tokens("\n\n".join(partials))
+            for _ in range(SUMMARY_MAX_MAP_PASSES):
+                if len(partials) <= 1 or tokens <= SUMMARY_LONG_TEXT_TOKENS:
+                    break
+                partials = await self._map_chunks(self._split_chunks("\n\n".join(partials), SUMMARY_CHUNK_TOKENS))
+                previous, tokens = tokens, self._estimate_tokens("\n\n".join(partials))
+                if tokens >= previous:
+                    logger.warning("Повторный map-этап не сократил текст, переходим к reduce")
+                    break
+
+        return self._build_reduce_prompt(partials)
+
+    async def _map_chunks(self, chunks: list) -> list:
+        """Конспектирует части параллельно с ограничением числа одновременных запросов."""
+        semaphore = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+
+        async def summarize_chunk(index: int, chunk: str) -> str:
+            prompt = self._build_map_prompt(chunk, index + 1, len(chunks))
+            async with semaphore:
+                # Одна повторная попытка: часть маленькая, и временный 429 не должен ронять весь конспект
+                attempts = 2
+                for attempt in range(attempts):
+                    response, model_name = await gemini_service.get_response_with_model(prompt)
+                    if model_name is not None:
+                        return response
+                    if attempt < attempts - 1:
+                        await asyncio.sleep(1 + attempt)
+            raise RuntimeError(f"Не удалось законспектировать часть {index + 1}: {response}")
+
+        tasks = [asyncio.ensure_future(summarize_chunk(i, c)) for i, c in enumerate(chunks)]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # Без одной части конспект все равно не собрать — остальные запросы не тратят квоту
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def _build_map_prompt(self, chunk: str, index: int, total: int) -> str:
+        return f"""
+Ты — профессиональный ассистент по обучению. Перед тобой часть {index} из {total} расшифровки длинной лекции.
+Составь подробные тезисы этой части в формате Markdown: ключевые термины с определениями, основные идеи, выводы и практические советы.
+Формулы записывай в LaTeX ( $...$ ). Не пиши вступлений и заключений, только тезисы. Пиши на языке оригинала.
+
+**Текст части:**
+{chunk}
+"""
+
+    def _build_reduce_prompt(self, partials: list) -> str:
+        joined = "\n\n".join(f"### Часть {i + 1}\n{p}" for i, p in enumerate(partials))
+        return f"""
+Ты — профессиональный ассистент по обучению. Ниже — тезисы последовательных частей одной длинной лекции.
+Объедини их в единый подробный и структурированный конспект, убери повторы, сохрани все термины, формулы и выводы.
+
+**ВАЖНОЕ ТРЕБОВАНИЕ К ФОРМАТУ:**
+1. На первой строке напиши ТОЛЬКО краткое и понятное название темы (не более 10 слов).
+2. Начиная со второй строки, напиши сам конспект в формате Markdown с логическими блоками и заголовками.
+3. Формулы оставляй в формате LaTeX, отделяя их пробелами от остального текста.
+4. Пиши на языке оригинала.
+
+**Тезисы частей:**
+{joined}
+
+**Ответ (Название на 1-й строке, затем конспект):**
+"""
+
+    def _build_prompt(self, text: str) -> str:
+        return f"""
 Ты — профессиональный ассистент по обучению. Твоя задача — составить подробный и структурированный конспект на основе предоставленного текста (субтитров из видео).
 
 **ВАЖНОЕ ТРЕБОВАНИЕ К ФОРМАТУ:**
@@ -106,51 +319,39 @@ class SummarizationService:
 
 **Ответ (Название на 1-й строке, затем конспект):**
 """
-        try:
-            response = await gemini_service.get_response(prompt)
-            if "Ошибка:" in response or "К сожалению" in response:
-                print(f"Gemini вернул ошибку, используем локальный суммаризатор. Ошибка: {response}")
-                return self.summarize(text)
-            
-            lines = response.strip().split('\n')
-            title = lines[0].strip().strip('#').strip('*').strip()
-            summary = '\n'.join(lines[1:]).strip()
-            
-            if not summary: # Если ИИ не разделил на строки
-                summary = response
-                title = self._extract_keywords(text)[0].capitalize() if self._extract_keywords(text) else "Конспект видео"
 
-            return {"title": title, "summary": summary}
-        except Exception as e:
-            print(f"Ошибка при вызове Gemini: {e}. Используем локальный суммаризатор.")
-            return self.summarize(text)
+    def _top_ranked(self, items: list, scores, max_count: int, max_chars: int = None) -> list:
+        """Лучшие по весу TextRank элементы (индекс, текст) без дубликатов, в порядке предложений в тексте."""
+        # Текст элемента может отличаться от предложения (регистр, оформление), поэтому
+        # отбор идет по индексам исходных предложений, а выводится оформленный текст
+        display = [None] * len(scores)
+        seen = set()
+        for index, item in items:
+            if item in seen:
+                continue
+            seen.add(item)
+            display[index] = item
+        candidates = [i for i, item in enumerate(display) if item is not None]
+        return select_sentences(display, scores, max_chars or float("inf"), max_count, candidates)
 
     def summarize(self, text: str) -> dict:
         if not text or len(text.strip()) < 50:
             return {"title": "Короткий текст", "summary": "Текст слишком короткий для полноценного конспекта."}
 
-        # Предварительная очистка
+        # Предварительная очистка (один проход)
         text = self._clean_text(text)
-        text = re.sub(r'\s+', ' ', text).strip()
         
-        # Разбиваем на предложения
-        raw_sentences = re.split(r'(?<=[.!?])\s+', text)
-        sentences = []
-        for s in raw_sentences:
-            s = s.strip()
-            if len(s) > 20 and not self._is_math_noise(s):
-                # Дополнительная чистка знаков в конце предложения
-                s = re.sub(r'[ ,;:-]+$', '', s)
-                if not s.endswith(('.', '!', '?')):
-                    s += '.'
-                sentences.append(s)
+        # Разбиваем на предложения и отбрасываем шум за один проход
+        sentences = list(text_engine.iter_content_sentences(text))
 
         # Извлекаем ключевые слова (уже очищенные)
         keywords = self._extract_keywords(text)
         
+        # Индексы предложений по разделам: (индекс, текст)
         definitions = []
         key_aspects = []
         theory = []
+        other = []
         
         # Маркеры
         def_markers = [
@@ -162,7 +363,7 @@ class SummarizationService:
         aspect_markers = ['важно', 'основное', 'главное', 'принцип', 'правило', 'запомните', 'суть']
         logic_markers = ['потому что', 'так как', 'следовательно', 'таким образом', 'в результате']
 
-        for sent in sentences:
+        for index, sent in enumerate(sentences):
             sent_lower = sent.lower()
             
             # 1. Ищем определения
@@ -177,7 +378,7 @@ class SummarizationService:
                         desc = parts[1].strip().strip(' .')
                         
                         if 2 < len(term.split()) < 6 and len(desc.split()) > 2:
-                            definitions.append(f"**{term}** — {desc}.")
+                            definitions.append((index, f"**{term}** — {desc}."))
                             is_def = True
                             break
             if is_def: continue
@@ -185,18 +386,29 @@ class SummarizationService:
             # 2. Основные аспекты
             if any(marker in sent_lower for marker in aspect_markers):
                 clean_a = re.sub(r'^(итак|в общем|на самом деле|кстати|стоит отметить что),?\s*', '', sent, flags=re.I)
-                key_aspects.append(clean_a.capitalize())
+                key_aspects.append((index, clean_a.capitalize()))
                 continue
                 
             # 3. Логические выводы и теория
-            if any(marker in sent_lower for marker in logic_markers) or any(kw in sent_lower for kw in keywords):
-                if 30 < len(sent) < 250:
-                    theory.append(sent.capitalize())
+            if 30 < len(sent) < 250:
+                if any(marker in sent_lower for marker in logic_markers) or any(kw in sent_lower for kw in keywords):
+                    theory.append((index, sent.capitalize()))
+                else:
+                    other.append((index, sent.capitalize()))
 
-        # Убираем дубликаты и оставляем расширенный список для длинных видео
-        definitions = list(dict.fromkeys(definitions))[:15]
-        key_aspects = list(dict.fromkeys(key_aspects))[:20]
-        theory = list(dict.fromkeys(theory))[:20]
+        if TEXTRANK_AVAILABLE and sentences:
+            # Отбор по центральности предложения в тексте (TextRank), а не первые N по порядку
+            scores = textrank_scores(sentences, self.stop_words)
+            definitions = self._top_ranked(definitions, scores, 15)
+            key_aspects = self._top_ranked(key_aspects, scores, 20)
+            theory = self._top_ranked(theory + other, scores, 20, SUMMARY_EXTRACTIVE_MAX_CHARS)
+            overview = self._top_ranked([(i, s) for i, s in enumerate(sentences)], scores, 5)
+        else:
+            # Убираем дубликаты и оставляем расширенный список для длинных видео
+            definitions = list(dict.fromkeys(d for _, d in definitions))[:15]
+            key_aspects = list(dict.fromkeys(a for _, a in key_aspects))[:20]
+            theory = list(dict.fromkeys(t for _, t in theory))[:20]
+            overview = sentences[:5]
 
         # Сборка Markdown
         markdown = []
@@ -217,6 +429,6 @@ class SummarizationService:
 
         if not (definitions or key_aspects or theory):
             markdown.append("\n## 📋 Краткое содержание")
-            markdown.extend([f"- {s}" for s in sentences[:5]])
+            markdown.extend([f"- {s}" for s in overview])
 
         return {"title": title, "summary": "\n".join(markdown)}
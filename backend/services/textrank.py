@@ -0,0 +1,95 @@
+import importlib.util
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# NumPy/SciPy нужны только для ранжирования; без них суммаризатор работает по старым эвристикам.
+# scipy.sparse импортируется при первом ранжировании: это заметная часть времени старта.
+try:
+    import numpy as np
+    TEXTRANK_AVAILABLE = importlib.util.find_spec("scipy") is not None
+    if not TEXTRANK_AVAILABLE:
+        logger.warning("TextRank недоступен: scipy не установлен")
+except Exception as e:
+    logger.warning("TextRank недоступен: %s", e)
+    TEXTRANK_AVAILABLE = False
+
+_WORD_RE = re.compile(r'\b[а-яёa-z]{3,}\b')
+
+
+def build_tfidf(sentences: list, stop_words: set):
+    """Разреженная TF-IDF матрица предложений (строки нормированы по L2)."""
+    from scipy import sparse
+    vocab = {}
+    rows, cols = [], []
+    for i, sentence in enumerate(sentences):
+        for word in _WORD_RE.findall(sentence.lower()):
+            if word in stop_words:
+                continue
+            rows.append(i)
+            cols.append(vocab.setdefault(word, len(vocab)))
+
+    n = len(sentences)
+    data = np.ones(len(rows), dtype=np.float64)
+    # Повторы (i, j) суммируются при переводе в CSR — это и есть частота слова в предложении
+    tf = sparse.csr_matrix((data, (rows, cols)), shape=(n, max(len(vocab), 1)))
+    tf.sum_duplicates()
+
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    idf = np.log((1 + n) / (1 + df)) + 1.0
+    x = tf.multiply(idf).tocsr()
+
+    norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ x
+
+
+def textrank_scores(sentences: list, stop_words: set, damping: float = 0.85, max_iter: int = 100, tol: float = 1e-6):
+    """PageRank по графу косинусного сходства предложений.
+
+    Матрица сходства W = X·Xᵀ не строится явно: каждое умножение на W считается
+    как X·(Xᵀ·v), поэтому итерация стоит O(число ненулевых элементов X), а не O(n²).
+    """
+    n = len(sentences)
+    if n == 0:
+        return np.zeros(0)
+
+    x = build_tfidf(sentences, stop_words)
+    xt = x.T.tocsr()
+    self_sim = np.asarray(x.multiply(x).sum(axis=1)).ravel()  # Диагональ W (1 или 0), исключаем петли
+
+    def w_dot(v):
+        return x @ (xt @ v) - self_sim * v
+
+    degree = w_dot(np.ones(n))
+    dangling = degree <= 1e-12
+    inv_degree = np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, degree))
+
+    scores = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        # Вершины без связей раздают свой вес равномерно
+        spread = scores[dangling].sum() / n
+        updated = (1 - damping) / n + damping * (w_dot(scores * inv_degree) + spread)
+        if np.abs(updated - scores).sum() < tol:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+
+def select_sentences(sentences: list, scores, max_chars: int, max_count: int, candidates=None) -> list:
+    """Берет предложения с наибольшим весом в пределах бюджета и возвращает их в исходном порядке."""
+    indices = range(len(sentences)) if candidates is None else candidates
+    ranked = sorted(indices, key=lambda i: -scores[i])
+    chosen = []
+    total = 0
+    for i in ranked:
+        if len(chosen) >= max_count:
+            break
+        length = len(sentences[i])
+        if total + length > max_chars and chosen:
+            continue
+        chosen.append(i)
+        total += length
+    return [sentences[i] for i in sorted(chosen)]
@@ -1,30 +1,201 @@
+import importlib.util
+import logging
 import os
-import uuid
-import yt_dlp
-import imageio_ffmpeg
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-
-# Используем pywhispercpp (whisper.cpp), так как он не зависит от torch
-try:
-    from pywhispercpp.model import Model
-    WHISPER_AVAILABLE = True
-except Exception as e:
-    print(f"Whisper не загружен: {e}")
-    WHISPER_AVAILABLE = False
-
-from backend.config import TEMP_DIR, MODELS_CPP_DIR, WHISPER_MODEL_SIZE
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Используем pywhispercpp (whisper.cpp), так как он не зависит от torch.
+# Наличие проверяем без импорта: библиотека и модель загружаются при прогреве, а не при старте.
+# yt_dlp, imageio_ffmpeg и youtube_transcript_api тоже импортируются при первом использовании.
+WHISPER_AVAILABLE = importlib.util.find_spec("pywhispercpp") is not None
+if not WHISPER_AVAILABLE:
+    logger.warning("Whisper не загружен: pywhispercpp не установлен")
+
+from backend.config import (
+    AUDIO_STREAMING, AUDIO_SAMPLE_RATE, AUDIO_STREAMING_MAX_SECONDS,
+    WHISPER_PARALLEL_WORKERS, WHISPER_PARALLEL_MIN_SECONDS,
+    TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_TTL, TRANSCRIPT_CACHE_MEMORY_ENTRIES, TRANSCRIPT_CACHE_MAX_BYTES,
+    SUBTITLES_LIST_TTL, SUBTITLES_SPECULATION, SPECULATION_MAX_CONCURRENT,
+    CAPTION_HISTORY_ENTRIES, CAPTION_HISTORY_TTL, CHANNEL_LOOKUP_TIMEOUT, HTTP_CONNECT_TIMEOUT,
+)
+from backend.metrics import span, SPECULATIVE_DOWNLOADS
+from backend.services.cache import LRUCache, TwoTierCache
+from backend.services.caption_history import CaptionHistory
+from backend.services.http_client import create_session
+from backend.services.model_pool import WhisperModelPool
+from backend.services.parallel_transcriber import ParallelTranscriber
+from backend.services.scratch import ScratchSpace, estimate_audio_bytes
 from backend.utils import clean_text, extract_video_id
 
+# Источники текста, которые сохраняются вместе с транскриптом в кэше
+SOURCE_MANUAL_SUBS = "manual_subs"
+SOURCE_AUTO_SUBS = "auto_subs"
+SOURCE_WHISPER = "whisper"
+
+# Автор видео без загрузки страницы: короткий JSON с author_url
+OEMBED_URL = "https://www.youtube.com/oembed"
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+@lru_cache(maxsize=1)
+def ffmpeg_exe() -> str:
+    """Путь к ffmpeg из imageio_ffmpeg; при первом вызове бинарник ищется (и при необходимости скачивается)."""
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def _no_progress(stage, data=None):
+    pass
+
+def _cancelled(cancel) -> bool:
+    return cancel is not None and cancel.is_set()
+
+class DownloadCancelled(Exception):
+    """Загрузка аудио больше не нужна: субтитры нашлись раньше."""
+
+class AudioPrefetch:
+    """Спекулятивная загрузка аудио, начатая до ответа о субтитрах.
+
+    Пока субтитры ищутся, прогресс загрузки клиенту не показывается; use() включает его,
+    discard() отменяет загрузку и удаляет ее файлы.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.cancel = threading.Event()
+        self.future = None
+        self._progress = None
+
+    def report(self, stage, data=None):
+        if self._progress is not None:
+            self._progress(stage, data)
+
+    def use(self, progress):
+        self._progress = progress
+        return self.future.result()
+
+    def discard(self):
+        self.cancel.set()
+        # Не ждем загрузку: она остановится сама, а ее файлы удалятся вместе с директорией задачи
+        self.future.add_done_callback(lambda _: self.job.close())
+
+def pcm16_to_float32(raw: bytes, out: np.ndarray = None) -> np.ndarray:
+    """Сырой PCM s16le -> float32 в диапазоне [-1, 1], как ожидает whisper.cpp.
+
+    Масштабирование на месте, без второй float32-копии; out — готовый буфер нужной длины.
+    """
+    pcm = np.frombuffer(raw, dtype=np.int16)
+    if out is None:
+        out = pcm.astype(np.float32)
+    else:
+        out[:] = pcm
+    out *= 1.0 / 32768.0
+    return out
+
+def load_wav(path: str) -> np.ndarray:
+    """Читает 16-битный моно WAV (результат ffmpeg в download_audio) в float32 массив."""
+    with wave.open(path, 'rb') as f:
+        return pcm16_to_float32(f.readframes(f.getnframes()))
+
 class TranscriptionService:
     def __init__(self):
-        self.whisper_model = None
+        self.model_pool = WhisperModelPool()
+        self.parallel = ParallelTranscriber() if WHISPER_PARALLEL_WORKERS > 1 else None
+        self.model_pool.parallel = self.parallel
+        self.cache = TwoTierCache(
+            TRANSCRIPT_CACHE_DIR,
+            max_entries=TRANSCRIPT_CACHE_MEMORY_ENTRIES,
+            max_bytes=TRANSCRIPT_CACHE_MAX_BYTES,
+            ttl=TRANSCRIPT_CACHE_TTL,
+            name="transcript",
+        )
+        # Один экземпляр API на общей сессии: keep-alive соединения вместо нового TLS на каждый запрос
+        # (создаются при первом запросе субтитров)
+        self.http = None
+        self._transcript_api = None
+        self._transcript_api_lock = threading.Lock()
+        self._transcript_lists = LRUCache(max_entries=TRANSCRIPT_CACHE_MEMORY_ENTRIES, ttl=SUBTITLES_LIST_TTL)
+        # Спекулятивная загрузка аудио: off — никогда, always — всегда, history — по истории видео/канала
+        self.speculation = SUBTITLES_SPECULATION
+        self.caption_history = CaptionHistory()
+        # video_id -> канал (author_url из oEmbed); "" — канал узнать не удалось
+        self._channels = LRUCache(max_entries=CAPTION_HISTORY_ENTRIES, ttl=CAPTION_HISTORY_TTL)
+        self.scratch = ScratchSpace()
+        self._speculation_slots = threading.BoundedSemaphore(SPECULATION_MAX_CONCURRENT)
+        self._speculation_pool = ThreadPoolExecutor(
+            max_workers=SPECULATION_MAX_CONCURRENT, thread_name_prefix="speculative-audio")
+        self._channel_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="channel-lookup")
+
+    def shutdown(self):
+        # Незавершенные спекулятивные загрузки больше никому не нужны
+        self._speculation_pool.shutdown(wait=False, cancel_futures=True)
+        self._channel_pool.shutdown(wait=False, cancel_futures=True)
+        self.scratch.stop()
+        if self.parallel is not None:
+            self.parallel.shutdown()
+
+    @property
+    def session(self):
+        if self.http is None:
+            with self._transcript_api_lock:
+                if self.http is None:
+                    self.http = create_session()
+        return self.http
+
+    @property
+    def transcript_api(self):
+        if self._transcript_api is None:
+            session = self.session
+            with self._transcript_api_lock:
+                if self._transcript_api is None:
+                    from youtube_transcript_api import YouTubeTranscriptApi
+                    self._transcript_api = YouTubeTranscriptApi(http_client=session)
+        return self._transcript_api
+
+    def resolve_channel(self, video_id: str):
+        """Канал видео (author_url) по oEmbed: один короткий запрос без страницы видео. None — не удалось."""
+        channel = self._channels.get(video_id)
+        if channel is None:
+            try:
+                response = self.session.get(
+                    OEMBED_URL,
+                    params={"url": f"https://www.youtube.com/watch?v={video_id}", "format": "json"},
+                    timeout=(HTTP_CONNECT_TIMEOUT, CHANNEL_LOOKUP_TIMEOUT),
+                )
+                response.raise_for_status()
+                channel = response.json().get("author_url") or ""
+            except Exception as e:
+                logger.debug("Не удалось узнать канал видео %s: %s", video_id, e)
+                return None
+            self._channels.set(video_id, channel)
+        return channel or None
 
     def get_subtitles(self, video_id: str) -> str:
         """Пытается получить субтитры через YouTube API."""
+        text, _ = self.fetch_subtitles(video_id)
+        return text
+
+    def list_transcripts(self, video_id: str):
+        """Список субтитров видео с коротким кэшем: повторный запрос того же видео обходится без запроса list."""
+        transcript_list = self._transcript_lists.get(video_id)
+        if transcript_list is None:
+            transcript_list = self.transcript_api.list(video_id)
+            self._transcript_lists.set(video_id, transcript_list)
+        return transcript_list
+
+    def fetch_subtitles(self, video_id: str) -> tuple:
+        """Возвращает (текст, источник) субтитров или ("", None), если их нет."""
+        # Ошибка создания сессии или клиента — это поломка конфигурации, а не «субтитров нет»
+        self.transcript_api
         try:
-            # В версии 1.2.3+ нужно создавать экземпляр API
-            api = YouTubeTranscriptApi()
-            transcript_list = api.list(video_id)
+            transcript_list = self.list_transcripts(video_id)
             
             # Приоритет: авторские (ru/en), потом любые другие, потом авто-генерация
             try:
@@ -46,21 +217,26 @@ class TranscriptionService:
                     texts.append(getattr(item, 'text', ''))
             
             text = " ".join(texts)
-            return clean_text(text)
-        except (TranscriptsDisabled, NoTranscriptFound, Exception) as e:
-            print(f"Субтитры не найдены или отключены: {e}")
-            return ""
+            source = SOURCE_AUTO_SUBS if getattr(transcript, 'is_generated', False) else SOURCE_MANUAL_SUBS
+            return clean_text(text), source
+        except Exception as e:
+            # TranscriptsDisabled, NoTranscriptFound и сетевые ошибки одинаково означают «субтитров нет»
+            logger.info("Субтитры не найдены или отключены: %s", e)
+            return "", None
 
-    def download_audio(self, url: str) -> str:
-        """Скачивает аудио из видео с максимальной скоростью."""
-        print(f"Начало скачивания аудио: {url}")
-        file_id = str(uuid.uuid4())
-        
-        ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
+    def download_audio(self, url: str, job, progress=None, cancel=None) -> str:
+        """Скачивает аудио из видео с максимальной скоростью в директорию задачи job (ScratchJob).
+
+        Файлы живут, пока задача не закрыта. cancel — threading.Event для отмены.
+        """
+        progress = progress or _no_progress
+        logger.info("Начало скачивания аудио: %s", url)
+        import yt_dlp
+        ffmpeg_path = ffmpeg_exe()
 
         ydl_opts = {
             'format': 'bestaudio[abr<=96]/bestaudio',
-            'outtmpl': os.path.join(TEMP_DIR, f"{file_id}.%(ext)s"),
+            'outtmpl': os.path.join(job.path, "audio.%(ext)s"),
             'quiet': True,
             'no_warnings': True,
             'noplaylist': True,
@@ -70,87 +246,392 @@ class TranscriptionService:
             'ignoreerrors': False,
             'log_tostderr': False,
             'no_color': True,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'user_agent': USER_AGENT,
+            'progress_hooks': [lambda d: self._report_download(d, progress, cancel)],
         }
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl, span("ytdlp_download"):
+                info = ydl.extract_info(url, download=False)
+                # Место резервируется до загрузки: при заполненной квоте ждем здесь, а не переполняем диск
+                job.reserve(estimate_audio_bytes(info), cancel=cancel)
+                info = ydl.process_ie_result(info, download=True)
                 temp_file = ydl.prepare_filename(info)
+                if _cancelled(cancel):
+                    raise DownloadCancelled()
                 
                 # Конвертируем в 16000Hz mono WAV через ffmpeg напрямую
-                final_wav = os.path.join(TEMP_DIR, f"{file_id}_16k.wav")
-                print(f"Конвертация в 16000Hz mono WAV: {final_wav}")
-                
-                import subprocess
-                # Используем список для безопасности
-                cmd = [
-                    ffmpeg_path,
-                    '-y',
-                    '-i', temp_file,
-                    '-ar', '16000',
-                    '-ac', '1',
-                    final_wav
-                ]
-                
-                # Запускаем без shell=True для надежности на Windows
-                subprocess.run(cmd, check=True, capture_output=True)
-                
+                final_wav = os.path.join(job.path, "audio_16k.wav")
+                self.convert_to_wav(temp_file, final_wav)
+
                 # Удаляем исходный скачанный файл (если он не .wav)
                 if temp_file != final_wav and os.path.exists(temp_file):
                     os.remove(temp_file)
                     
-                print(f"Аудио готово: {final_wav}")
+                logger.info("Аудио готово: %s", final_wav)
                 return final_wav
         except Exception as e:
-            print(f"Ошибка при загрузке/конвертации аудио: {e}")
+            if _cancelled(cancel):
+                logger.debug("Загрузка аудио %s отменена", url)
+            else:
+                logger.error("Ошибка при загрузке/конвертации аудио: %s", e)
             return ""
 
-    def transcribe_local(self, audio_path: str) -> str:
-        """Транскрибирует аудио через pywhispercpp."""
+    def convert_to_wav(self, source: str, target: str):
+        """Конвертирует аудиофайл в 16000Hz mono WAV через ffmpeg."""
+        logger.debug("Конвертация в 16000Hz mono WAV: %s", target)
+        # Используем список для безопасности
+        cmd = [
+            ffmpeg_exe(),
+            '-y',
+            '-i', source,
+            '-ar', str(AUDIO_SAMPLE_RATE),
+            '-ac', '1',
+            target
+        ]
+        # Запускаем без shell=True для надежности на Windows
+        with span("ffmpeg_convert"):
+            subprocess.run(cmd, check=True, capture_output=True)
+
+    def _report_download(self, d: dict, progress, cancel=None):
+        """progress_hook для yt-dlp: пересылает прогресс скачивания и прерывает отмененную загрузку."""
+        if _cancelled(cancel):
+            raise DownloadCancelled()
+        if d.get('status') != 'downloading':
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        progress("download_progress", {
+            "downloaded_bytes": d.get('downloaded_bytes'),
+            "total_bytes": total,
+            "percent": round(d['downloaded_bytes'] * 100 / total, 1) if total and d.get('downloaded_bytes') else None,
+        })
+
+    def stream_audio(self, url: str, progress=None, cancel=None):
+        """Потоковая загрузка: ffmpeg читает аудиопоток и отдает 16 кГц моно PCM в stdout.
+
+        Ничего не пишет на диск. Возвращает float32 массив или None при ошибке или отмене (cancel).
+        """
+        progress = progress or _no_progress
+        logger.info("Потоковая загрузка аудио: %s", url)
+        import yt_dlp
+        ffmpeg_path = ffmpeg_exe()
+
+        ydl_opts = {
+            'format': 'bestaudio[abr<=96]/bestaudio',
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'nocheckcertificate': True,
+            'no_color': True,
+            'user_agent': USER_AGENT,
+        }
+
+        try:
+            # yt-dlp только выбирает поток и отдает прямую ссылку, скачивает сам ffmpeg
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl, span("ytdlp_extract"):
+                info = ydl.extract_info(url, download=False)
+            if _cancelled(cancel):
+                return None
+            duration = info.get('duration')
+            if duration and duration > AUDIO_STREAMING_MAX_SECONDS:
+                # Длинная лекция целиком в памяти — сотни мегабайт на запрос; такие идут через диск
+                logger.info("Видео длиннее %d сек, аудио загружается во временный файл", AUDIO_STREAMING_MAX_SECONDS)
+                return None
+
+            stream_url = info.get('url')
+            if not stream_url and info.get('requested_formats'):
+                stream_url = info['requested_formats'][0].get('url')
+            if not stream_url:
+                logger.warning("Не удалось получить прямую ссылку на аудиопоток")
+                return None
+
+            headers = info.get('http_headers') or {}
+            cmd = [ffmpeg_path, '-nostdin', '-loglevel', 'error']
+            if headers:
+                cmd += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in headers.items())]
+            cmd += [
+                '-i', stream_url,
+                '-vn',
+                '-f', 's16le',
+                '-acodec', 'pcm_s16le',
+                '-ac', '1',
+                '-ar', str(AUDIO_SAMPLE_RATE),
+                'pipe:1'
+            ]
+
+            # Буфер под все аудио выделяется сразу по длительности (с запасом в секунду),
+            # и блоки PCM переводятся в float32 прямо в него: в памяти одна копия аудио
+            audio = np.empty(int((duration or 0) * AUDIO_SAMPLE_RATE) + AUDIO_SAMPLE_RATE, dtype=np.float32)
+            filled = 0
+            received = 0
+            bytes_per_second = AUDIO_SAMPLE_RATE * 2
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # Сюда входит и скачивание: ffmpeg сам читает поток по ссылке
+            with span("ffmpeg_stream"):
+                try:
+                    # Читаем PCM блоками по ~10 секунд, чтобы сообщать о прогрессе
+                    while True:
+                        if _cancelled(cancel):
+                            proc.kill()
+                            break
+                        block = proc.stdout.read(bytes_per_second * 10)
+                        if not block:
+                            break
+                        # read(n) возвращает меньше n только в конце потока
+                        block = block[:len(block) - len(block) % 2]
+                        count = len(block) // 2
+                        if filled + count > len(audio):
+                            # Длительность неизвестна или оказалась неточной — растим буфер с запасом
+                            grown = np.empty(max(len(audio) * 2, filled + count), dtype=np.float32)
+                            grown[:filled] = audio[:filled]
+                            audio = grown
+                        pcm16_to_float32(block, audio[filled:filled + count])
+                        filled += count
+                        received += len(block)
+                        seconds = received / bytes_per_second
+                        progress("download_progress", {
+                            "seconds": round(seconds, 1),
+                            "percent": round(min(seconds * 100 / duration, 100), 1) if duration else None,
+                        })
+                    stderr = proc.stderr.read()
+                finally:
+                    proc.stdout.close()
+                    proc.stderr.close()
+                    returncode = proc.wait()
+
+            if _cancelled(cancel):
+                logger.debug("Потоковая загрузка %s отменена", url)
+                return None
+            if returncode != 0:
+                logger.error("Ошибка ffmpeg при потоковой загрузке: %s", stderr.decode(errors='ignore')[-500:])
+                return None
+
+            audio = audio[:filled]
+            logger.info("Аудио получено в память: %.1f сек", len(audio) / AUDIO_SAMPLE_RATE)
+            return audio if len(audio) else None
+        except Exception as e:
+            logger.error("Ошибка при потоковой загрузке аудио: %s", e)
+            return None
+
+    def transcribe_local(self, audio, progress=None) -> str:
+        """Транскрибирует аудио через pywhispercpp.
+
+        audio — путь к WAV (файл удаляется после обработки) или float32 массив 16 кГц.
+        """
+        progress = progress or _no_progress
         if not WHISPER_AVAILABLE:
-            print("Транскрибация невозможна: Whisper не загружен.")
+            logger.error("Транскрибация невозможна: Whisper не загружен.")
             return ""
 
-        print(f"Начало транскрибации файла: {audio_path}")
+        audio_path = audio if isinstance(audio, str) else None
+        logger.info("Начало транскрибации: %s", audio_path or 'аудио в памяти')
         try:
-            if self.whisper_model is None:
-                print(f"Загрузка модели Whisper ({WHISPER_MODEL_SIZE})...")
-                self.whisper_model = Model(WHISPER_MODEL_SIZE, models_dir=MODELS_CPP_DIR)
-                print("Модель загружена.")
-            
-            print("Запуск распознавания...")
-            # pywhispercpp возвращает список объектов сегментов
-            segments = self.whisper_model.transcribe(audio_path)
+            if self.parallel is not None:
+                samples = load_wav(audio_path) if audio_path else audio
+                if len(samples) >= WHISPER_PARALLEL_MIN_SECONDS * AUDIO_SAMPLE_RATE:
+                    logger.debug("Запуск параллельного распознавания...")
+                    try:
+                        segments = self.parallel.transcribe(samples, progress)
+                    except BrokenProcessPool:
+                        # Пул процессов упал — распознаем моделью в этом процессе
+                        logger.warning("Пул процессов Whisper недоступен, распознавание в основном процессе")
+                    else:
+                        logger.info("Транскрибация завершена.")
+                        return clean_text(" ".join(text for _, _, text in segments))
+                audio = samples
+
+            with self.model_pool.checkout() as model:
+                logger.debug("Запуск распознавания...")
+                # pywhispercpp возвращает список объектов сегментов
+                segments = model.transcribe(
+                    audio,
+                    new_segment_callback=lambda seg: progress("segment", {
+                        "start": seg.t0 / 100.0,
+                        "end": seg.t1 / 100.0,
+                        "text": seg.text.strip(),
+                    }),
+                )
             text = " ".join([s.text for s in segments])
-            print("Транскрибация завершена.")
+            logger.info("Транскрибация завершена.")
         except Exception as e:
-            print(f"Ошибка при транскрибации: {e}")
+            logger.error("Ошибка при транскрибации: %s", e)
             text = ""
         finally:
             # Удаляем временный файл
-            if os.path.exists(audio_path):
+            if audio_path and os.path.exists(audio_path):
                 os.remove(audio_path)
             
         return clean_text(text)
 
-    def process(self, url: str) -> str:
-        """Основной метод обработки: субтитры -> транскрибация."""
-        video_id = extract_video_id(url)
-        if not video_id:
-            return "Ошибка: Неверный URL YouTube"
+    def _store(self, video_id: str, text: str, source: str):
+        self.cache.set(video_id, {
+            "video_id": video_id,
+            "text": text,
+            "source": source,
+            "created_at": time.time(),
+        })
+
+    def process(self, url: str, progress=None, channel_id: str = None) -> str:
+        """Основной метод обработки: субтитры -> транскрибация.
+
+        progress — необязательный колбэк progress(stage, data) для отслеживания этапов.
+        channel_id — канал видео (author_url), если уже известен; иначе он узнается по oEmbed.
+        """
+        progress = progress or _no_progress
+        with span("transcription"):
+            video_id = extract_video_id(url)
+            if not video_id:
+                return "Ошибка: Неверный URL YouTube"
+            text, prefetch = self.lookup_text(url, video_id, progress, channel_id)
+            if text:
+                return text
+            return self.transcribe_audio(url, video_id, progress, prefetch)
 
+    def lookup_text(self, url: str, video_id: str, progress=None, channel_id: str = None) -> tuple:
+        """Быстрый путь: кэш транскриптов, затем субтитры.
+
+        Возвращает (текст, prefetch). Пустой текст — нужен Whisper; prefetch — уже начатая
+        спекулятивная загрузка аудио (AudioPrefetch или None), ее передают в transcribe_audio.
+        Нашлись субтитры — загрузка отменяется, а уже скачанное выбрасывается.
+        """
+        progress = progress or _no_progress
+        text = self._cached_text(video_id, progress)
+        if text:
+            return text, None
+
+        prefetch = None
+        channel = None
+        if self._should_speculate(video_id, channel_id):
+            prefetch = self._start_prefetch(url, video_id)
+        elif self.speculation == "history" and channel_id is None:
+            # Канал узнаем параллельно с поиском субтитров: если у канала субтитров обычно нет,
+            # загрузка стартует, не дожидаясь ответа о них
+            decision = threading.Lock()
+            started = []
+            subtitles_done = False
+
+            def on_channel(future):
+                if future.cancelled() or future.exception() is not None:
+                    return
+                with decision:
+                    if not subtitles_done and self.caption_history.likely_missing(video_id, future.result()):
+                        started.append(self._start_prefetch(url, video_id))
+
+            channel = self._channel_pool.submit(self.resolve_channel, video_id)
+            channel.add_done_callback(on_channel)
+
+        text = None
+        try:
+            text = self._subtitle_text(video_id, progress)
+        finally:
+            if channel is not None:
+                with decision:
+                    subtitles_done = True
+                    prefetch = started[0] if started else None
+            if text is None and prefetch is not None:
+                prefetch.discard()
+
+        if channel is None:
+            self.caption_history.record(video_id, bool(text), channel_id)
+        else:
+            # Канал может прийти позже субтитров — тогда видео учтется в статистике канала по готовности
+            self.caption_history.record(video_id, bool(text))
+
+            def on_resolved(future):
+                if not future.cancelled() and future.exception() is None:
+                    self.caption_history.set_channel(video_id, future.result())
+
+            channel.add_done_callback(on_resolved)
+
+        if prefetch is not None:
+            if text:
+                prefetch.discard()
+                SPECULATIVE_DOWNLOADS.labels("discarded").inc()
+                return text, None
+            SPECULATIVE_DOWNLOADS.labels("used").inc()
+        return text, prefetch
+
+    def _should_speculate(self, video_id: str, channel_id: str = None) -> bool:
+        if self.speculation == "always":
+            return True
+        if self.speculation == "history":
+            return self.caption_history.likely_missing(video_id, channel_id)
+        return False
+
+    def _start_prefetch(self, url: str, video_id: str):
+        """Запускает загрузку аудио в фоне; None, если все слоты спекулятивных загрузок заняты."""
+        # Лимит на спекулятивные загрузки: при нагрузке лишний трафик не оправдан
+        if not self._speculation_slots.acquire(blocking=False):
+            return None
+        prefetch = AudioPrefetch(self.scratch.open_job())
+        logger.debug("Спекулятивная загрузка аудио для %s", video_id)
+        try:
+            prefetch.future = self._speculation_pool.submit(
+                self.acquire_audio, url, prefetch.job, prefetch.report, prefetch.cancel)
+        except RuntimeError:
+            # Пул уже остановлен (завершение работы сервиса)
+            self._speculation_slots.release()
+            prefetch.job.close()
+            return None
+        prefetch.future.add_done_callback(lambda _: self._speculation_slots.release())
+        return prefetch
+
+    def _cached_text(self, video_id: str, progress) -> str:
+        # 0. Проверяем кэш транскриптов
+        with span("transcript_cache"):
+            cached = self.cache.get(video_id)
+        if cached:
+            logger.info("Транскрипт %s найден в кэше (источник: %s).", video_id, cached['source'])
+            progress("cache_hit", {"source": cached["source"]})
+            return cached["text"]
+        return ""
+
+    def _subtitle_text(self, video_id: str, progress) -> str:
         # 1. Пробуем получить субтитры
-        print(f"Пробуем получить субтитры для {video_id}...")
-        text = self.get_subtitles(video_id)
+        logger.debug("Пробуем получить субтитры для %s...", video_id)
+        progress("subtitles", {"video_id": video_id})
+        with span("subtitles"):
+            text, source = self.fetch_subtitles(video_id)
         if text:
-            print("Субтитры успешно получены.")
+            logger.info("Субтитры успешно получены.")
+            progress("subtitles_found", {"chars": len(text), "source": source})
+            self._store(video_id, text, source)
             return text
+        return ""
+
+    def transcribe_audio(self, url: str, video_id: str, progress=None, prefetch: AudioPrefetch = None) -> str:
+        """Медленный путь: загрузка аудио и распознавание Whisper.
+
+        prefetch — спекулятивная загрузка из lookup_text: аудио уже в пути, ждем ее вместо новой.
+        """
+        progress = progress or _no_progress
 
         # 2. Если субтитров нет, скачиваем аудио и транскрибируем
-        print("Субтитры не найдены, переходим к локальной транскрибации...")
-        audio_path = self.download_audio(url)
-        if audio_path:
-            return self.transcribe_local(audio_path)
+        logger.info("Субтитры не найдены, переходим к локальной транскрибации...")
+        progress("downloading", {})
+        if prefetch is not None:
+            with prefetch.job:
+                return self._transcribe_acquired(video_id, prefetch.use(progress), progress)
+        with self.scratch.open_job() as job:
+            audio = self.acquire_audio(url, job, progress)
+            return self._transcribe_acquired(video_id, audio, progress)
+
+    def acquire_audio(self, url: str, job, progress=None, cancel=None):
+        """Аудио видео: float32 массив (потоковый режим), путь к WAV в директории job или None/"" при ошибке."""
+        with span("audio"):
+            audio = self.stream_audio(url, progress, cancel) if AUDIO_STREAMING else None
+            if audio is None and not _cancelled(cancel):
+                # Запасной путь через временные файлы
+                audio = self.download_audio(url, job, progress, cancel)
+        return audio
+
+    def _transcribe_acquired(self, video_id: str, audio, progress) -> str:
+        if audio is not None and len(audio):
+            progress("transcribing", {})
+            with span("whisper"):
+                text = self.transcribe_local(audio, progress)
+            if text:
+                self._store(video_id, text, SOURCE_WHISPER)
+            return text
         
         return "Ошибка: Не удалось получить текст видео (субтитры отсутствуют, а загрузка аудио не удалась)"
@@ -0,0 +1,211 @@
+import json
+from contextlib import aclosing
+
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from backend.config import UPLOAD_CHUNK_SIZE
+
+# Форматы, которые принимает Gemini Vision
+ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
+# Некоторые браузеры и мобильные клиенты не указывают тип — тогда решают магические байты
+GENERIC_TYPES = {"", "application/octet-stream"}
+# Запас на заголовки multipart сверх размера самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+# Сколько первых байт файла нужно sniff_image_type
+SNIFF_BYTES = 16
+
+
+class UploadRejected(Exception):
+    """Загрузка отклонена; status_code — код HTTP-ответа."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadTooLarge(UploadRejected):
+    def __init__(self, limit: int):
+        super().__init__(413, f"Файл слишком большой (максимум {limit // (1024 * 1024)} МБ)")
+
+
+def sniff_image_type(head: bytes):
+    """Тип изображения по первым байтам файла или None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    return None
+
+
+def _check_declared_type(content_type: str):
+    declared = (content_type or "").split(";")[0].strip().lower()
+    if declared not in ALLOWED_IMAGE_TYPES and declared not in GENERIC_TYPES:
+        raise UploadRejected(415, f"Неподдерживаемый тип файла: {declared}")
+
+
+def _check_magic(head: bytes) -> str:
+    mime_type = sniff_image_type(head[:SNIFF_BYTES])
+    if mime_type is None:
+        raise UploadRejected(415, "Файл не похож на изображение (JPEG, PNG, WEBP или HEIC)")
+    return mime_type
+
+
+class ImageMultiPartParser(MultiPartParser):
+    """Разбор multipart, который проверяет файл прямо во время чтения тела.
+
+    Заявленный тип части и магические байты проверяются, как только пришли заголовки
+    и первые байты файла, а размер — по мере поступления данных. Не-изображение или
+    слишком большой файл отклоняются, не дочитывая запрос и не записывая его во временный файл.
+    """
+
+    def __init__(self, headers, stream, max_bytes: int, **kwargs):
+        super().__init__(headers, stream, **kwargs)
+        self.max_bytes = max_bytes
+        self._head = b""
+        self._size = 0
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        if self._current_part.file is not None:
+            _check_declared_type(self._current_part.file.content_type)
+            self._head = b""
+            self._size = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current_part.file is not None:
+            self._size += end - start
+            if self._size > self.max_bytes:
+                raise UploadTooLarge(self.max_bytes)
+            if len(self._head) < SNIFF_BYTES:
+                self._head += data[start:min(end, start + SNIFF_BYTES - len(self._head))]
+                if len(self._head) == SNIFF_BYTES:
+                    _check_magic(self._head)
+        super().on_part_data(data, start, end)
+
+    def on_part_end(self) -> None:
+        # Файл короче SNIFF_BYTES проверяется целиком в конце части
+        if self._current_part.file is not None and len(self._head) < SNIFF_BYTES:
+            _check_magic(self._head)
+        super().on_part_end()
+
+
+async def parse_image_form(request, max_bytes: int, max_fields: int = 5):
+    """Форма с одним изображением (FormData); файл проверяется во время разбора тела.
+
+    Закрыть форму (form.close()) должен вызывающий.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "multipart/form-data":
+        raise UploadRejected(415, "Ожидается multipart/form-data с файлом изображения")
+    async with aclosing(request.stream()) as stream:
+        parser = ImageMultiPartParser(request.headers, stream, max_bytes, max_files=1, max_fields=max_fields)
+        try:
+            return await parser.parse()
+        except MultiPartException as e:
+            raise UploadRejected(400, e.message)
+
+
+async def read_image_upload(upload, max_bytes: int) -> tuple:
+    """Читает загруженное изображение блоками с жестким лимитом.
+
+    Тип проверяется по заявленному Content-Type и по магическим байтам первого блока.
+    Возвращает (bytearray с содержимым, mime_type по содержимому) — без лишней копии файла.
+    """
+    _check_declared_type(upload.content_type)
+
+    first = await upload.read(UPLOAD_CHUNK_SIZE)
+    mime_type = _check_magic(first)
+
+    data = bytearray(first)
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > max_bytes:
+            raise UploadTooLarge(max_bytes)
+    return data, mime_type
+
+
+class BodySizeLimitMiddleware:
+    """ASGI-middleware: ограничивает размер тела запроса для указанных путей.
+
+    При известном Content-Length лишнее отклоняется сразу, без чтения тела.
+    Для chunked-запросов байты считаются по мере чтения, и превышение лимита
+    прерывает разбор формы исключением UploadTooLarge.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        body_limit = limit + MULTIPART_OVERHEAD
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > body_limit:
+            await self._reject(send, UploadTooLarge(limit))
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > body_limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send, error: UploadRejected):
+        body = json.dumps({"detail": error.detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionLimiter:
+    """Неблокирующий лимит одновременных задач: при заполнении новые сразу получают отказ, а не ждут в очереди."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        # Вызывается только из event loop, поэтому блокировка не нужна
+        if self.active >= self.limit:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active = max(self.active - 1, 0)
+
+    def stats(self) -> dict:
+        return {"active": self.active, "limit": self.limit, "rejected": self.rejected}
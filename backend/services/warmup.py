@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+
+
+class Warmup:
+    """Фоновый прогрев после старта: тяжелые импорты, поиск ffmpeg, загрузка модели Whisper.
+
+    Сервер принимает соединения сразу, но /readyz отвечает 503, пока прогрев не закончен.
+    Обязательный шаг, завершившийся ошибкой, оставляет экземпляр неготовым; необязательный
+    только ждется (например, модель Whisper: без нее работают субтитры и Gemini).
+    """
+
+    def __init__(self):
+        self._steps = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name: str, func, required: bool = True):
+        self._steps[name] = {"func": func, "required": required, "status": PENDING, "seconds": None, "error": None}
+
+    def record(self, name: str, seconds: float):
+        """Добавляет в отчет уже выполненный шаг (например, импорт приложения)."""
+        self._steps[name] = {"func": None, "required": False, "status": OK, "seconds": seconds, "error": None}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        started = time.perf_counter()
+        for name, step in self._steps.items():
+            if step["status"] != PENDING:
+                continue
+            step_started = time.perf_counter()
+            try:
+                step["func"]()
+                status, error = OK, None
+            except Exception as e:
+                logger.error("Прогрев: шаг %s завершился ошибкой: %s", name, e)
+                status, error = FAILED, str(e)
+            with self._lock:
+                step["status"] = status
+                step["error"] = error
+                step["seconds"] = time.perf_counter() - step_started
+            logger.info("Прогрев: %s — %s за %.0f мс", name, status, step["seconds"] * 1000)
+        logger.info("Прогрев завершен за %.1f сек", time.perf_counter() - started)
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._ready()
+
+    def _ready(self) -> bool:
+        for step in self._steps.values():
+            if step["status"] == PENDING or (step["required"] and step["status"] == FAILED):
+                return False
+        return True
+
+    def report(self) -> dict:
+        with self._lock:
+            steps = {
+                name: {
+                    "status": step["status"],
+                    "required": step["required"],
+                    "ms": round(step["seconds"] * 1000) if step["seconds"] is not None else None,
+                    **({"error": step["error"]} if step["error"] else {}),
+                }
+                for name, step in self._steps.items()
+            }
+            return {"ready": self._ready(), "steps": steps}
@@ -0,0 +1,53 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.gemini_service import SHARED_GROUP, _entry_group, slice_schedule
+
+GROUP_LABELS = [
+    ("1", "1"),
+    ("2", "2"),
+    (2, "2"),
+    ("both", SHARED_GROUP),
+    ("all", SHARED_GROUP),
+    ("", SHARED_GROUP),
+    (None, SHARED_GROUP),
+    ("общий", SHARED_GROUP),
+    ("Общая", SHARED_GROUP),
+    ("1, 2", SHARED_GROUP),
+    ("1 и 2", SHARED_GROUP),
+    ("10S-2", "2"),
+    ("9O-1", "1"),
+    ("11A-2", "2"),
+    ("12S-1", "1"),
+    ("1 группа", "1"),
+    ("2 группа", "2"),
+    ("группа 2", "2"),
+    ("Группа 1", "1"),
+    ("10S", None),
+    ("11A", None),
+    ("группа 3", None),
+    ("left", None),
+]
+
+
+def test_entry_group_labels():
+    for label, expected in GROUP_LABELS:
+        assert _entry_group(label) == expected, label
+
+
+def test_slice_schedule_skips_unknown_groups():
+    entries = [
+        {"title": "Алгебра", "group": "10S-1"},
+        {"title": "Физика", "group": "10S-2"},
+        {"title": "История", "group": "both"},
+        {"title": "Химия", "group": "10S"},
+    ]
+    assert [e["title"] for e in slice_schedule(entries, "1")] == ["Алгебра", "История"]
+    assert [e["title"] for e in slice_schedule(entries, "2")] == ["Физика", "История"]
+    assert all("group" not in e for e in slice_schedule(entries, "1"))
+
+
+if __name__ == "__main__":
+    test_entry_group_labels()
+    test_slice_schedule_skips_unknown_groups()
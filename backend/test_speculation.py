@@ -0,0 +1,73 @@
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.transcriber import TranscriptionService
+
+
+def test_channel_without_captions_downloads_during_subtitle_lookup():
+    """У канала с записанными промахами аудио начинает качаться, пока субтитры еще ищутся."""
+    service = TranscriptionService()
+    service.speculation = "history"
+    for video_id in ("chanVideo01", "chanVideo02"):
+        service.caption_history.record(video_id, False, "https://www.youtube.com/@channel")
+
+    events = {}
+    download_started = threading.Event()
+
+    def fetch_subtitles(video_id):
+        # Ответ о субтитрах приходит заметно позже, чем ответ oEmbed
+        download_started.wait(2)
+        events["subtitles_done"] = time.monotonic()
+        return "", None
+
+    def acquire_audio(url, job, progress=None, cancel=None):
+        events["download_started"] = time.monotonic()
+        download_started.set()
+        return [0.0]
+
+    service.fetch_subtitles = fetch_subtitles
+    service.resolve_channel = lambda video_id: "https://www.youtube.com/@channel"
+    service.acquire_audio = acquire_audio
+    service._transcribe_acquired = lambda video_id, audio, progress: "текст из аудио"
+    try:
+        text = service.process("https://www.youtube.com/watch?v=newVideo003")
+    finally:
+        service.shutdown()
+
+    assert text == "текст из аудио"
+    assert events["download_started"] < events["subtitles_done"]
+
+
+def test_unknown_channel_waits_for_subtitles():
+    """Без истории канала загрузка не начинается, пока не ясно, что субтитров нет."""
+    service = TranscriptionService()
+    service.speculation = "history"
+    events = []
+
+    def fetch_subtitles(video_id):
+        time.sleep(0.1)
+        events.append("subtitles")
+        return "", None
+
+    def acquire_audio(url, job, progress=None, cancel=None):
+        events.append("download")
+        return [0.0]
+
+    service.fetch_subtitles = fetch_subtitles
+    service.resolve_channel = lambda video_id: "https://www.youtube.com/@other"
+    service.acquire_audio = acquire_audio
+    service._transcribe_acquired = lambda video_id, audio, progress: "текст из аудио"
+    try:
+        service.process("https://www.youtube.com/watch?v=newVideo004")
+    finally:
+        service.shutdown()
+
+    assert events == ["subtitles", "download"]
+
+
+if __name__ == "__main__":
+    test_channel_without_captions_downloads_during_subtitle_lookup()
+    test_unknown_channel_waits_for_subtitles()
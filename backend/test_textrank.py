@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.summarizer import SummarizationService
+from backend.services.textrank import TEXTRANK_AVAILABLE
+
+
+def test_theory_keeps_transcript_order():
+    """Пункты «Теоретической базы» идут в порядке текста, даже если часть из них попала туда по ключевым словам."""
+    summarizer = SummarizationService()
+    sentences = [
+        "Первое предложение рассказывает про обычные вещи без терминов",
+        "Второе предложение объясняет параболу и ее вершину подробно",
+        "Третье предложение снова рассказывает про обычные вещи вокруг",
+        "Четвертое предложение показывает параболу на графике функции",
+    ]
+    # Ключевое слово есть только во 2-м и 4-м — они попадут в theory, 1-е и 3-е в other
+    items = [(1, sentences[1]), (3, sentences[3]), (0, sentences[0]), (2, sentences[2])]
+    scores = [0.4, 0.3, 0.2, 0.1]
+    assert summarizer._top_ranked(items, scores, 20) == sentences
+
+    # Дубликат оставляет первое вхождение, отбор по весу все равно возвращает порядок текста
+    items.append((2, sentences[1]))
+    assert summarizer._top_ranked(items, scores, 2) == [sentences[0], sentences[1]]
+
+
+if __name__ == "__main__":
+    if TEXTRANK_AVAILABLE:
+        test_theory_keeps_transcript_order()
+        print("✅ ТЕСТ ПРОЙДЕН: порядок предложений сохранен")
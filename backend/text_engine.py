@@ -0,0 +1,105 @@
+"""Скомпилированные один раз регулярные выражения для нормализации и фильтрации текста.
+
+Вместо десятков отдельных re.sub/re.search правила одного вида объединены в одну
+альтернацию, а предложения классифицируются за один ленивый проход по тексту.
+"""
+import re
+
+# Таймкоды вида [00:00.000 --> 00:00.000]
+_TIMECODE_RE = re.compile(r'\[\d{2}:\d{2}\.\d{3}\s*-->\s*\d{2}:\d{2}\.\d{3}\]')
+
+# Приветствия и типичные вступления блогеров
+_INTRO_PATTERNS = [
+    r'здравствуйте\s+ребята', r'всем\s+привет', r'с\s+вами\s+реальные\s+венатор',
+    r'сегодня\s+на\s+уроке', r'мы\s+разберем', r'добро\s+пожаловать',
+    r'подписывайтесь\s+на\s+канал', r'ставьте\s+лайки',
+]
+
+# Опережающая проверка первой буквы позволяет движку не перебирать всю альтернацию
+# на каждой позиции текста: так объединенный паттерн быстрее и последовательных re.sub
+_INTRO_FIRST = ''.join(sorted({p[0] for p in _INTRO_PATTERNS} | {p[0].upper() for p in _INTRO_PATTERNS}))
+_INTRO_RE = re.compile(f'(?=[{_INTRO_FIRST}])(?:' + '|'.join(_INTRO_PATTERNS) + ')', re.I)
+
+# Базовая пунктуация: пробелы перед знаками убираются, после знаков — добавляются
+_SPACE_BEFORE_PUNCT_RE = re.compile(r'\s+([.,!?])')
+_NO_SPACE_AFTER_PUNCT_RE = re.compile(r'([.,!?])(?=[^\s])')
+
+# Паттерны чисто арифметических вычислений и координат, объединенные в одну альтернацию
+_MATH_PATTERNS = [
+    r'\d+\s*(?:плюс|минус|умножить|разделить|равно|равняется|получится|в\s+степени|в\s+квадрате)',
+    r'(?:плюс|минус|умножить|разделить|равно|равняется|получится)\s*\d+',
+    r'\d+\s*[+\-*/=]\s*\d+',
+    r'икс\s+равно', r'игрек\s+равно', r'зед\s+равно',
+    r'результате\s+у\s+нас\s+получится',
+    r'это\s+будет\s+минус\s+\d+',
+    r'вершина\s+параболы\s+у\s+нас\s+будет',
+    r'\d+\s+умножить\s+на\s+\d+',
+    r'квадрате\s+минус\s+\d+',
+    r'\d+\s+и\s+минус\s+\d+',  # Паттерн "3 и минус 4"
+    r'точку\s+нашли', r'координаты', r'ось\s+икс', r'ось\s+игрек',
+]
+_MATH_RE = re.compile('|'.join(f'(?:{p})' for p in _MATH_PATTERNS))
+
+_DIGIT_RE = re.compile(r'\d')
+_LETTER_RE = re.compile(r'[а-яё]')
+
+# Предложение: все до знака конца предложения и пробела (или до конца текста)
+_SENTENCE_RE = re.compile(r'\S.*?(?:(?<=[.!?])(?=\s)|$)', re.S)
+_TRAILING_RE = re.compile(r'[ ,;:-]+$')
+
+
+def collapse_whitespace(text: str) -> str:
+    """Схлопывает любые пробельные символы (включая \\xa0) в один пробел и обрезает края."""
+    return ' '.join(text.split())
+
+
+def clean_text(text: str) -> str:
+    """Очистка текста от таймкодов и лишних пробелов."""
+    if not text:
+        return ""
+    # Таймкоды встречаются только в выводе Whisper, для субтитров этот проход пропускается
+    if '-->' in text:
+        text = _TIMECODE_RE.sub('', text)
+    return collapse_whitespace(text)
+
+
+def normalize_transcript(text: str) -> str:
+    """Убирает вступления блогеров и исправляет пробелы вокруг пунктуации."""
+    text = _INTRO_RE.sub('', text)
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r'\1', text)
+    text = _NO_SPACE_AFTER_PUNCT_RE.sub(r'\1 ', text)
+    return collapse_whitespace(text)
+
+
+def is_math_noise(text: str) -> bool:
+    """True, если предложение — арифметический расчет, а не теория."""
+    text_lower = text.lower()
+
+    # Если в предложении слишком много цифр по отношению к буквам - это скорее всего расчет
+    if _DIGIT_RE.search(text) is not None:
+        digits = len(_DIGIT_RE.findall(text))
+        letters = len(_LETTER_RE.findall(text_lower))
+        if letters > 0 and (digits / letters) > 0.3:
+            return True
+
+    return _MATH_RE.search(text_lower) is not None
+
+
+def iter_sentences(text: str):
+    """Лениво перебирает предложения без промежуточного списка."""
+    for m in _SENTENCE_RE.finditer(text):
+        sentence = m.group().strip()
+        if sentence:
+            yield sentence
+
+
+def iter_content_sentences(text: str, min_length: int = 20):
+    """Классифицирует предложения за один проход: отбрасывает короткие и математический шум,
+    дочищает концы и добавляет точку."""
+    for sentence in iter_sentences(text):
+        if len(sentence) <= min_length or is_math_noise(sentence):
+            continue
+        sentence = _TRAILING_RE.sub('', sentence)
+        if not sentence.endswith(('.', '!', '?')):
+            sentence += '.'
+        yield sentence